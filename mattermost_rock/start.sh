@@ -14,11 +14,49 @@ to_mm_bool() {
     esac
 }
 
+# Helper: convert a log level name to a Mattermost advanced logging level entry.
+# Unknown level names are reported on stderr and skipped.
+to_mm_log_level() {
+    case "$1" in
+        panic) echo '{"ID": 0, "Name": "panic", "Stacktrace": true}' ;;
+        fatal) echo '{"ID": 1, "Name": "fatal", "Stacktrace": true}' ;;
+        error) echo '{"ID": 2, "Name": "error", "Stacktrace": true}' ;;
+        warn) echo '{"ID": 3, "Name": "warn"}' ;;
+        info) echo '{"ID": 4, "Name": "info"}' ;;
+        debug) echo '{"ID": 5, "Name": "debug"}' ;;
+        trace) echo '{"ID": 6, "Name": "trace"}' ;;
+        *) echo "Ignoring unknown log level '$1'" >&2 ;;
+    esac
+}
+
 # ---------------------------------------------------------------------------
 # Core database and service settings
 # ---------------------------------------------------------------------------
 export MM_SQLSETTINGS_DRIVERNAME=postgres
-export MM_SQLSETTINGS_DATASOURCE="postgres://${POSTGRESQL_DB_CONNECT_STRING#postgresql://}"
+# The connection string names the primary endpoint of the relation, a service
+# which follows the primary after a failover. lib/pq only connects to a single
+# host, so the replicas are not listed. connect_timeout bounds the time spent
+# on the endpoint while it moves to the new primary, so that the connection
+# pool retries instead of hanging.
+POSTGRESQL_CONNECT_TIMEOUT=5
+POSTGRESQL_DSN="postgres://${POSTGRESQL_DB_CONNECT_STRING#postgresql://}?connect_timeout=${POSTGRESQL_CONNECT_TIMEOUT}"
+
+# PgBouncer in transaction pooling mode hands every transaction to any server
+# connection, so nothing may outlive a transaction on the server side.
+# binary_parameters makes lib/pq send the query parameters along with the query
+# instead of preparing a statement first. Client connections to the pooler
+# hold no server connection while idle, so each unit keeps its whole pool open
+# and the number of server connections is bounded by the pooler, not by the
+# number of Mattermost units.
+if [ "$POSTGRESQL_DB_POOLER" = "pgbouncer" ]; then
+    case "$POSTGRESQL_DSN" in
+        *\?*) POSTGRESQL_DSN="${POSTGRESQL_DSN}&binary_parameters=yes" ;;
+        *) POSTGRESQL_DSN="${POSTGRESQL_DSN}?binary_parameters=yes" ;;
+    esac
+    export MM_SQLSETTINGS_MAXOPENCONNS=100
+    export MM_SQLSETTINGS_MAXIDLECONNS=100
+fi
+export MM_SQLSETTINGS_DATASOURCE="$POSTGRESQL_DSN"
 export MM_CONFIG="$MM_SQLSETTINGS_DATASOURCE"
 export MM_SERVICESETTINGS_LISTENADDRESS=:8080
 export MM_SERVICESETTINGS_SITEURL="${APP_BASE_URL:-http://localhost:8080}"
@@ -34,13 +72,40 @@ if [ -n "$APP_LICENCE" ]; then
 fi
 
 # Logging
-export MM_LOGSETTINGS_ENABLECONSOLE=true
+# The console output is configured as an advanced logging target so that its
+# level list and asynchronous queue size can be tuned. The basic console target
+# is disabled to avoid writing every line twice.
+export MM_LOGSETTINGS_ENABLECONSOLE=false
 export MM_LOGSETTINGS_ENABLEFILE=false
 if [ "$(to_mm_bool "$APP_DEBUG")" = "true" ]; then
     export MM_LOGSETTINGS_CONSOLELEVEL=DEBUG
+    LOG_LEVELS="panic,fatal,error,warn,info,debug"
 else
     export MM_LOGSETTINGS_CONSOLELEVEL=INFO
+    LOG_LEVELS="panic,fatal,error,warn,info"
 fi
+if [ -n "$APP_LOG_LEVELS" ]; then
+    LOG_LEVELS="$APP_LOG_LEVELS"
+fi
+
+# JSON lines let Loki detect the log level at ingest time (used by the Loki alert rules)
+if [ "$(to_mm_bool "${APP_LOG_CONSOLE_JSON:-true}")" = "true" ]; then
+    MM_LOGSETTINGS_CONSOLEJSON=true
+    LOG_FORMAT=json
+else
+    MM_LOGSETTINGS_CONSOLEJSON=false
+    LOG_FORMAT=plain
+fi
+export MM_LOGSETTINGS_CONSOLEJSON
+
+LOG_LEVELS_JSON=""
+for level in $(echo "$LOG_LEVELS" | tr ',' ' ' | tr '[:upper:]' '[:lower:]'); do
+    level_json="$(to_mm_log_level "$level")"
+    if [ -n "$level_json" ]; then
+        LOG_LEVELS_JSON="${LOG_LEVELS_JSON:+$LOG_LEVELS_JSON, }$level_json"
+    fi
+done
+export MM_LOGSETTINGS_ADVANCEDLOGGINGJSON="{\"console\": {\"Type\": \"console\", \"Format\": \"$LOG_FORMAT\", \"Levels\": [$LOG_LEVELS_JSON], \"Options\": {\"Out\": \"stdout\"}, \"MaxQueueSize\": ${APP_LOG_MAX_QUEUE_SIZE:-1000}}}"
 
 # Image proxy
 MM_IMAGEPROXYSETTINGS_ENABLE="$(to_mm_bool "$APP_IMAGE_PROXY_ENABLED")"
@@ -63,6 +128,14 @@ if [ -n "$APP_MAX_FILE_SIZE" ]; then
     export MM_FILESETTINGS_MAXFILESIZE=$(( APP_MAX_FILE_SIZE * 1048576 ))
 fi
 
+# Image previews, thumbnails and document content extraction
+export MM_FILESETTINGS_MAXIMAGERESOLUTION="${APP_IMAGE_MAX_RESOLUTION:-33177600}"
+export MM_FILESETTINGS_MAXIMAGEDECODERCONCURRENCY="${APP_IMAGE_DECODER_CONCURRENCY:--1}"
+MM_FILESETTINGS_EXTRACTCONTENT="$(to_mm_bool "${APP_EXTRACT_CONTENT:-true}")"
+export MM_FILESETTINGS_EXTRACTCONTENT
+MM_FILESETTINGS_ARCHIVERECURSION="$(to_mm_bool "${APP_EXTRACT_CONTENT_ARCHIVE_RECURSION:-false}")"
+export MM_FILESETTINGS_ARCHIVERECURSION
+
 # Push notifications
 if [ -n "$APP_PUSH_NOTIFICATION_SERVER" ]; then
     export MM_EMAILSETTINGS_SENDPUSHNOTIFICATIONS=true
@@ -104,7 +177,7 @@ MM_SERVICESETTINGS_ENABLEUSERACCESSTOKENS="$(to_mm_bool "$APP_ENABLE_USER_ACCESS
 export MM_SERVICESETTINGS_ENABLEUSERACCESSTOKENS
 
 # ---------------------------------------------------------------------------
-# S3 file storage configuration (from s3 integration)
+# File storage configuration (from s3 integration, file-store storage otherwise)
 # ---------------------------------------------------------------------------
 if [ -n "$S3_BUCKET" ]; then
     export MM_FILESETTINGS_DRIVERNAME=amazons3
@@ -122,6 +195,29 @@ if [ -n "$S3_BUCKET" ]; then
         export MM_FILESETTINGS_AMAZONS3ENDPOINT="${S3_ENDPOINT#http://}"
         export MM_FILESETTINGS_AMAZONS3SSL=false
     fi
+
+    # Transfer tuning
+    export MM_FILESETTINGS_AMAZONS3UPLOADPARTSIZEBYTES=$(( ${APP_S3_UPLOAD_PART_SIZE:-5} * 1048576 ))
+    export MM_FILESETTINGS_AMAZONS3REQUESTTIMEOUTMILLISECONDS=$(( ${APP_S3_REQUEST_TIMEOUT:-30} * 1000 ))
+    case "${APP_S3_SIGNATURE_VERSION:-auto}" in
+        v2) export MM_FILESETTINGS_AMAZONS3SIGNV2=true ;;
+        v4) export MM_FILESETTINGS_AMAZONS3SIGNV2=false ;;
+        auto)
+            if [ "$S3_API_VERSION" = "2" ]; then
+                export MM_FILESETTINGS_AMAZONS3SIGNV2=true
+            else
+                export MM_FILESETTINGS_AMAZONS3SIGNV2=false
+            fi
+            ;;
+        *)
+            echo "Unknown s3-signature-version '$APP_S3_SIGNATURE_VERSION', using v4" >&2
+            export MM_FILESETTINGS_AMAZONS3SIGNV2=false
+            ;;
+    esac
+else
+    # Local file store on the file-store storage
+    export MM_FILESETTINGS_DRIVERNAME=local
+    export MM_FILESETTINGS_DIRECTORY=/app/data/
 fi
 
 # SMTP email settings configuration (from smtp integration)
@@ -181,4 +277,29 @@ if [ -n "$APP_OAUTH_CLIENT_ID" ]; then
     export MM_OPENIDSETTINGS_DISCOVERYENDPOINT="${APP_OAUTH_API_BASE_URL}/.well-known/openid-configuration"
 fi
 
+# ---------------------------------------------------------------------------
+# OpenSearch full-text search (from opensearch integration)
+# ---------------------------------------------------------------------------
+if [ -n "$OPENSEARCH_URL" ]; then
+    export MM_ELASTICSEARCHSETTINGS_BACKEND=opensearch
+    export MM_ELASTICSEARCHSETTINGS_CONNECTIONURL="$OPENSEARCH_URL"
+    export MM_ELASTICSEARCHSETTINGS_USERNAME="$OPENSEARCH_USERNAME"
+    export MM_ELASTICSEARCHSETTINGS_PASSWORD="$OPENSEARCH_PASSWORD"
+    export MM_ELASTICSEARCHSETTINGS_INDEXPREFIX="$OPENSEARCH_INDEX_PREFIX"
+    # The endpoints are Kubernetes pod addresses, node sniffing is not needed
+    export MM_ELASTICSEARCHSETTINGS_SNIFF=false
+    if [ -n "$OPENSEARCH_CA" ]; then
+        printf '%s' "$OPENSEARCH_CA" > /tmp/opensearch-ca.pem
+        export MM_ELASTICSEARCHSETTINGS_CA=/tmp/opensearch-ca.pem
+    fi
+    MM_ELASTICSEARCHSETTINGS_ENABLEINDEXING="$(to_mm_bool "${APP_OPENSEARCH_ENABLE_INDEXING:-true}")"
+    export MM_ELASTICSEARCHSETTINGS_ENABLEINDEXING
+    MM_ELASTICSEARCHSETTINGS_ENABLESEARCHING="$(to_mm_bool "${APP_OPENSEARCH_ENABLE_SEARCHING:-false}")"
+    export MM_ELASTICSEARCHSETTINGS_ENABLESEARCHING
+    export MM_ELASTICSEARCHSETTINGS_ENABLEAUTOCOMPLETE="$MM_ELASTICSEARCHSETTINGS_ENABLESEARCHING"
+    export MM_ELASTICSEARCHSETTINGS_LIVEINDEXINGBATCHSIZE="${APP_OPENSEARCH_LIVE_INDEXING_BATCH_SIZE:-10}"
+    export MM_ELASTICSEARCHSETTINGS_BATCHSIZE="${APP_OPENSEARCH_BULK_INDEXING_BATCH_SIZE:-10000}"
+    export MM_ELASTICSEARCHSETTINGS_REQUESTTIMEOUTSECONDS="${APP_OPENSEARCH_REQUEST_TIMEOUT:-30}"
+fi
+
 exec /app/bin/mattermost
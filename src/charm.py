@@ -4,22 +4,81 @@
 
 """Go Charm entrypoint."""
 
+import dataclasses
+import json
 import logging
 import time
 import typing
 
 import ops
 import paas_charm.go
+from charms.data_platform_libs.v0.data_interfaces import OpenSearchRequires
+from opentelemetry import trace
 from ops.pebble import ExecError, LayerDict
+from paas_charm.app import WorkloadConfig
+from paas_charm.charm_state import CharmState
+from paas_charm.exceptions import CharmConfigInvalidError, RelationDataError
+
+from image_cache import (
+    IMAGE_CACHE_CONFIG_PATH,
+    IMAGE_CACHE_PORT,
+    IMAGE_CACHE_SERVICE,
+    ImageCacheConfig,
+    render_nginx_config,
+)
+from workload import (
+    MattermostApp,
+    check_database_pooler,
+    get_opensearch_environment,
+    get_postgresql_pooler,
+    get_rclone_s3_destination,
+    get_rclone_s3_environment,
+)
 
 logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
 
 SOCKET_PATH = "/var/tmp/mattermost_local.socket"
+# Hard floor, in seconds, between two workload restarts of a unit
+RESTART_MIN_INTERVAL = 10
+# Longest wait, in seconds, for the end of the restart window within a hook
+RESTART_MAX_WAIT = 10
+# Seconds between two progress reports of a Mattermost job
+JOB_POLL_INTERVAL = 10
+JOB_FINAL_STATUSES = ("success", "error", "canceled")
+# Owner of the workload files, the _daemon_ user of the rock
+WORKLOAD_USER_ID = 584792
+# Local file store, on the file-store storage
+FILE_STORE_PATH = "/app/data"
+# CA chain of the S3 endpoint, written in the workload container for rclone
+S3_CA_PATH = "/tmp/s3-ca.pem"
+# Seconds between two progress reports of a file migration
+MIGRATION_STATS_INTERVAL = 10
+MIB = 1024 * 1024
+
+
+def _format_migration_progress(stats: dict[str, typing.Any]) -> str:
+    """Format the progress of a file migration from the statistics reported by rclone.
+
+    Args:
+        stats: rclone statistics.
+
+    Returns:
+        The progress message.
+    """
+    return (
+        f"Uploaded {stats.get('transfers', 0)}/{stats.get('totalTransfers', 0)} files, "
+        f"{stats.get('bytes', 0) / MIB:.1f}/{stats.get('totalBytes', 0) / MIB:.1f} MiB "
+        f"at {stats.get('speed', 0) / MIB:.1f} MiB/s, {stats.get('checks', 0)} already present"
+    )
 
 
 class MattermostK8sCharm(paas_charm.go.Charm):
     """Go Charm service."""
 
+    _restarts = ops.StoredState()
+    _image_cache = ops.StoredState()
+
     def __init__(self, *args: typing.Any) -> None:
         """Initialize the instance.
 
@@ -28,8 +87,278 @@ class MattermostK8sCharm(paas_charm.go.Charm):
         """
         super().__init__(*args)
 
+        # the charm state, with the secrets of the integrations, is built once per hook
+        self._charm_state: CharmState | None = None
+
+        # ops records every event handler, Pebble call and hook tool call as a span
+        self._charm_tracing = ops.tracing.Tracing(self, tracing_relation_name="charm-tracing")
+
+        # Mattermost manages its own index templates, which requires the admin role
+        self._opensearch = OpenSearchRequires(
+            self, "opensearch", index=self.app.name, extra_user_roles="admin"
+        )
+        for event in (
+            self._opensearch.on.index_created,
+            self._opensearch.on.endpoints_changed,
+            self._opensearch.on.authentication_updated,
+            self.on["opensearch"].relation_broken,
+        ):
+            self.framework.observe(event, self._on_opensearch_changed)
+
+        # the storage mount point is handed over to the workload user before restarting
+        self.framework.observe(self.on.file_store_storage_attached, self._on_storage_attached)
+
+        # the image cache is configured along with the workload
+        self._image_cache.set_default(running=False)
+        self.framework.observe(
+            self.on["image-cache"].pebble_ready, self._on_image_cache_pebble_ready
+        )
+
+        # restarts requested by event handlers are coalesced and applied before commit
+        self._restarts.set_default(last_restart=0.0, pending=False, rerun_migrations=False)
+        self.framework.observe(self.framework.on.pre_commit, self._on_pre_commit)
+
         # actions
         self.framework.observe(self.on.grant_admin_role_action, self._on_grant_admin_role_action)
+        self.framework.observe(self.on.reindex_search_action, self._on_reindex_search_action)
+        self.framework.observe(
+            self.on.migrate_files_to_s3_action, self._on_migrate_files_to_s3_action
+        )
+
+    def _create_charm_state(self) -> CharmState:
+        """Create the charm state, or reuse the one already created in this hook.
+
+        Building the state reads every integration, including the Juju secrets of the SMTP
+        password, the OAuth client secret and the secret-typed configuration options. It
+        is built once per hook, and again for the restart applied before commit, after the
+        event handlers changed what they had to. The configuration options of the charm are
+        checked along with those of paas-charm.
+
+        Raises:
+            CharmConfigInvalidError: If a configuration option is invalid.
+
+        Returns:
+            The charm state.
+        """
+        if self._charm_state is None:
+            check_database_pooler(str(self.config.get("database-pooler", "auto")))
+            self._charm_state = super()._create_charm_state()
+        return self._charm_state
+
+    def _create_app(self) -> MattermostApp:
+        """Build a MattermostApp instance.
+
+        Returns:
+            A new MattermostApp instance.
+        """
+        postgresql = self._database_requirers["postgresql"]
+        return MattermostApp(
+            container=self._container,
+            charm_state=self._create_charm_state(),
+            workload_config=self._workload_config,
+            database_migration=self._database_migration,
+            postgresql_pooler=get_postgresql_pooler(
+                postgresql, str(self.config.get("database-pooler", "auto"))
+            ),
+            opensearch_env=get_opensearch_environment(self._opensearch),
+        )
+
+    def _on_opensearch_changed(self, _: ops.EventBase) -> None:
+        """Handle the changes of the opensearch integration."""
+        self.restart()
+
+    def _on_storage_attached(self, _: ops.StorageAttachedEvent) -> None:
+        """Handle the attachment of a storage to the workload."""
+        self.restart()
+
+    def _on_image_cache_pebble_ready(self, _: ops.PebbleReadyEvent) -> None:
+        """Handle the image-cache container becoming ready."""
+        self.restart()
+
+    @property
+    def _workload_config(self) -> WorkloadConfig:
+        """Return the WorkloadConfig, exposing the image cache instead of Mattermost if enabled."""
+        workload_config = super()._workload_config
+        if self._image_cache_enabled():
+            workload_config = dataclasses.replace(workload_config, port=IMAGE_CACHE_PORT)
+        return workload_config
+
+    def _image_cache_enabled(self) -> bool:
+        """Check whether the caching proxy of the image-cache container is enabled and started.
+
+        The workload configuration is read many times per hook, including by the paas-charm
+        constructor, so the state recorded by the last configuration of the image cache is
+        used rather than asking Pebble.
+
+        Returns:
+            bool: True if the ingress traffic goes through the caching proxy.
+        """
+        if not self._image_cache_requested():
+            return False
+        # the paas-charm constructor runs before the defaults of this charm are set
+        self._image_cache.set_default(running=False)
+        return bool(self._image_cache.running)
+
+    def _image_cache_requested(self) -> bool:
+        """Check whether the configuration needs the caching proxy of the image-cache container.
+
+        Returns:
+            bool: True if remote images or static assets are cached.
+        """
+        return bool(
+            self.config.get("image-cache-enabled") or self.config.get("static-cache-enabled")
+        )
+
+    def restart(self, rerun_migrations: bool = False) -> None:
+        """Request a restart of the workload, applied once at the end of the hook.
+
+        Args:
+            rerun_migrations: whether it is necessary to run the migrations again.
+        """
+        self._restarts.pending = True
+        self._restarts.rerun_migrations = self._restarts.rerun_migrations or rerun_migrations
+
+    def _on_pre_commit(self, _: ops.EventBase) -> None:
+        """Apply the restart requested by this hook or postponed by an earlier one.
+
+        A running workload is restarted at most once per coalescing window. A hook ending
+        shortly before the end of the window waits for it, later requests are kept in the
+        stored state and applied by the first hook after the window, at the latest on
+        update-status. The caching proxy, the ingress and the opened port are not postponed.
+        """
+        if not self._restarts.pending:
+            return
+        self._charm_state = None
+        self._configure_image_cache()
+        window = max(
+            int(self.config.get("restart-coalesce-window", RESTART_MIN_INTERVAL)),
+            RESTART_MIN_INTERVAL,
+        )
+        remaining = window - (time.time() - self._restarts.last_restart)
+        if remaining > 0 and self._workload_running():
+            if remaining > RESTART_MAX_WAIT:
+                logger.info("Postponing restart for %ds (window %ds)", remaining, window)
+                self._ingress.provide_ingress_requirements(port=self._workload_config.port)
+                self.unit.set_ports(ops.Port(protocol="tcp", port=self._workload_config.port))
+                self.update_app_and_unit_status(ops.MaintenanceStatus("restart pending"))
+                return
+            logger.info("Waiting %.1fs for the end of the restart window", remaining)
+            time.sleep(remaining)
+        rerun_migrations = self._restarts.rerun_migrations
+        self._restarts.pending = False
+        self._restarts.rerun_migrations = False
+        self._prepare_storage_mounts()
+        service = self._workload_service()
+        # the event handlers already returned, block the charm like their decorator would
+        try:
+            super().restart(rerun_migrations=rerun_migrations)
+        except CharmConfigInvalidError as exc:
+            logger.exception("Wrong Charm Configuration")
+            self.update_app_and_unit_status(ops.BlockedStatus(exc.msg))
+            return
+        except RelationDataError as exc:
+            logger.exception(
+                "%s relation data is either invalid, missing or unusable.", exc.relation
+            )
+            self.update_app_and_unit_status(ops.BlockedStatus(str(exc)))
+            return
+        # only a change of the service plan restarts the workload and opens a new window
+        if service != self._workload_service():
+            self._restarts.last_restart = time.time()
+
+    def _prepare_storage_mounts(self) -> None:
+        """Give the workload user the ownership of the storage mounted in the container.
+
+        Volumes are mounted as root, while Mattermost runs as the _daemon_ user of the rock.
+        Only the mount point is changed, the files in it are created by Mattermost.
+        """
+        container = self.unit.get_container("app")
+        if not container.can_connect():
+            return
+        for mount in self.framework.meta.containers["app"].mounts.values():
+            if not container.exists(mount.location):
+                continue
+            (info,) = container.list_files(mount.location, itself=True)
+            if info.user_id == WORKLOAD_USER_ID:
+                continue
+            owner = f"{WORKLOAD_USER_ID}:{WORKLOAD_USER_ID}"
+            container.exec(["chown", owner, mount.location]).wait()
+
+    def _configure_image_cache(self) -> None:
+        """Configure the caching proxy of the image-cache container, or stop it if disabled."""
+        enabled = self._image_cache_requested()
+        if not enabled and not self._image_cache.running:
+            return
+        container = self.unit.get_container("image-cache")
+        if not container.can_connect():
+            return
+        service = container.get_services(IMAGE_CACHE_SERVICE).get(IMAGE_CACHE_SERVICE)
+        if not enabled:
+            # the service is gone if the pod was rescheduled since it was started
+            if service and service.is_running():
+                container.stop(IMAGE_CACHE_SERVICE)
+            self._image_cache.running = False
+            return
+
+        images = None
+        if self.config.get("image-cache-enabled"):
+            images = ImageCacheConfig(
+                max_size=int(self.config.get("image-cache-max-size", 1024)),
+                max_object_size=int(self.config.get("image-cache-max-object-size", 10)),
+                ttl=int(self.config.get("image-cache-ttl", 86400)),
+            )
+        config = render_nginx_config(
+            mattermost_port=super()._workload_config.port,
+            images=images,
+            static_assets=bool(self.config.get("static-cache-enabled")),
+        )
+        layer: LayerDict = {
+            "summary": "Image cache layer",
+            "services": {
+                IMAGE_CACHE_SERVICE: {
+                    "override": "replace",
+                    "summary": "Caching proxy in front of Mattermost",
+                    "command": "nginx -g 'daemon off;'",
+                    "startup": "enabled",
+                }
+            },
+        }
+        container.add_layer("image-cache", layer, combine=True)
+        try:
+            current = container.pull(IMAGE_CACHE_CONFIG_PATH).read()
+        except ops.pebble.PathError:
+            current = None
+        if current != config:
+            container.push(IMAGE_CACHE_CONFIG_PATH, config, make_dirs=True)
+            # a reload keeps serving the open connections, websockets included
+            if service and service.is_running():
+                container.exec(["nginx", "-s", "reload"]).wait()
+        container.replan()
+        self._image_cache.running = True
+
+    def _workload_service(self) -> ops.pebble.ServiceDict | None:
+        """Get the workload service from the plan of the container.
+
+        Returns:
+            The service definition, None if the service or the container is not available.
+        """
+        container = self.unit.get_container("app")
+        if not container.can_connect():
+            return None
+        service = container.get_plan().services.get(self._workload_config.service_name)
+        return service.to_dict() if service else None
+
+    def _workload_running(self) -> bool:
+        """Check whether the workload services are running.
+
+        Returns:
+            bool: True if every workload service is running.
+        """
+        container = self.unit.get_container("app")
+        if not container.can_connect():
+            return False
+        services = container.get_services()
+        return bool(services) and all(service.is_running() for service in services.values())
 
     def _on_grant_admin_role_action(self, event: ops.ActionEvent) -> None:
         """Grant the "system_admin" role to a specified user.
@@ -63,11 +392,169 @@ class MattermostK8sCharm(paas_charm.go.Charm):
         except ExecError as ex:
             event.fail(f"Failed to grant admin role to user {user}: {ex.stderr}")
         finally:
-            self._set_local_mode(container, enable=False)
-            try:
-                container.remove_path(SOCKET_PATH)
-            except ops.pebble.PathError:
-                pass
+            self._disable_local_mode(container)
+
+    def _on_reindex_search_action(self, event: ops.ActionEvent) -> None:
+        """Start a full reindex of the OpenSearch indexes and monitor it.
+
+        Args:
+            event: Event triggering the reindex-search action.
+        """
+        if not self._opensearch.relations:
+            event.fail("The opensearch integration is required to reindex")
+            return
+        self._run_job(event, "elasticsearch_post_indexing")
+
+    def _on_migrate_files_to_s3_action(self, event: ops.ActionEvent) -> None:
+        """Upload the files of the local file store to the bucket of the s3 integration.
+
+        rclone runs in the workload container, where the file-store storage is mounted.
+        Objects already in the bucket with the same size and checksum are skipped, so a
+        migration that failed or was interrupted resumes where it stopped when rerun.
+
+        Args:
+            event: Event triggering the migrate-files-to-s3 action.
+        """
+        s3 = self._s3.to_relation_data() if self._s3 else None
+        if s3 is None:
+            event.fail("The s3 integration is required to migrate the files")
+            return
+        container = self.unit.get_container("app")
+        if not container.can_connect():
+            event.fail("Unable to connect to container, container is not ready")
+            return
+
+        chunk_size = int(event.params.get("chunk-size", 16))
+        cmd = ["rclone", "copy", FILE_STORE_PATH, get_rclone_s3_destination(s3), "--checksum"]
+        cmd += [
+            f"--transfers={int(event.params.get('transfers', 4))}",
+            f"--s3-upload-concurrency={int(event.params.get('upload-concurrency', 4))}",
+            f"--s3-chunk-size={chunk_size}M",
+            f"--s3-upload-cutoff={chunk_size}M",
+            f"--stats={MIGRATION_STATS_INTERVAL}s",
+            "--stats-log-level=NOTICE",
+            "--use-json-log",
+        ]
+        if s3.tls_ca_chain:
+            container.push(S3_CA_PATH, "\n".join(s3.tls_ca_chain))
+            cmd.append(f"--ca-cert={S3_CA_PATH}")
+
+        stats: dict[str, typing.Any] = {}
+        errors: list[str] = []
+        try:
+            process = container.exec(cmd, environment=get_rclone_s3_environment(s3))
+            # the logs and statistics of rclone are read from its own stderr pipe, which
+            # exec always opens since no stderr is passed to it
+            for line in typing.cast(typing.IO[str], process.stderr):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("level") == "error":
+                    errors.append(record.get("msg", "").strip())
+                if "stats" in record:
+                    stats = record["stats"]
+                    event.log(_format_migration_progress(stats))
+            process.wait()
+        except ExecError as ex:
+            error = errors[-1] if errors else f"exit code {ex.exit_code}"
+            event.fail(
+                f"Migration failed with {len(errors)} errors, rerun to resume. Last: {error}"
+            )
+            return
+
+        elapsed = float(stats.get("elapsedTime", 0))
+        event.set_results(
+            {
+                "uploaded-files": stats.get("transfers", 0),
+                "skipped-files": stats.get("checks", 0),
+                "uploaded-bytes": stats.get("bytes", 0),
+                "duration": round(elapsed),
+                "throughput": f"{stats.get('bytes', 0) / MIB / max(elapsed, 1):.1f} MiB/s",
+            }
+        )
+
+    def _run_job(self, event: ops.ActionEvent, job_type: str) -> None:
+        """Create a Mattermost job and report its progress until it completes.
+
+        Args:
+            event: Event triggering the action running the job.
+            job_type: Type of the Mattermost job.
+        """
+        container = self.unit.get_container("app")
+        if not container.can_connect():
+            event.fail("Unable to connect to container, container is not ready")
+            return
+
+        timeout = int(event.params.get("timeout", 3600))
+        try:
+            if not self._set_local_mode(container, enable=True):
+                event.fail("Mattermost socket failed to initialize after 30 seconds")
+                return
+
+            job = self._call_local_api(container, "POST", "/api/v4/jobs", {"type": job_type})
+            event.log(f"Started {job_type} job {job['id']}")
+            time_elapsed = 0
+            while job["status"] not in JOB_FINAL_STATUSES:
+                if time_elapsed >= timeout:
+                    event.fail(
+                        f"Job {job['id']} did not complete within {timeout} seconds, "
+                        f"last status {job['status']} at {job.get('progress', 0)}%"
+                    )
+                    return
+                time.sleep(JOB_POLL_INTERVAL)
+                time_elapsed += JOB_POLL_INTERVAL
+                job = self._call_local_api(container, "GET", f"/api/v4/jobs/{job['id']}")
+                event.log(f"Job {job['id']} {job['status']}: {job.get('progress', 0)}%")
+
+            if job["status"] != "success":
+                error = (job.get("data") or {}).get("error", "")
+                event.fail(f"Job {job['id']} ended with status {job['status']}: {error}")
+                return
+            event.set_results(
+                {"job-id": job["id"], "status": job["status"], "duration": time_elapsed}
+            )
+        except ExecError as ex:
+            event.fail(f"Failed to run the {job_type} job: {ex.stderr}")
+        finally:
+            self._disable_local_mode(container)
+
+    def _call_local_api(
+        self,
+        container: ops.Container,
+        method: str,
+        path: str,
+        body: dict[str, typing.Any] | None = None,
+    ) -> dict[str, typing.Any]:
+        """Call the Mattermost API through the local mode socket.
+
+        Args:
+            container: The Pebble container for the app.
+            method: HTTP method.
+            path: Path of the API endpoint.
+            body: JSON body of the request.
+
+        Returns:
+            The decoded JSON response.
+        """
+        cmd = ["curl", "--silent", "--show-error", "--fail", "--unix-socket", SOCKET_PATH]
+        cmd += ["--request", method, f"http://localhost{path}"]
+        if body is not None:
+            cmd += ["--header", "Content-Type: application/json", "--data", json.dumps(body)]
+        stdout, _ = container.exec(cmd).wait_output()
+        return json.loads(stdout)
+
+    def _disable_local_mode(self, container: ops.Container) -> None:
+        """Disable local mode and remove its socket.
+
+        Args:
+            container: The Pebble container for the app.
+        """
+        self._set_local_mode(container, enable=False)
+        try:
+            container.remove_path(SOCKET_PATH)
+        except ops.pebble.PathError:
+            pass
 
     def _set_local_mode(self, container: ops.Container, enable: bool) -> bool:
         """Toggle local mode via Pebble layer and wait for readiness if enabling.
@@ -99,13 +586,14 @@ class MattermostK8sCharm(paas_charm.go.Charm):
         poll_interval = 2
         time_elapsed = 0
 
-        while time_elapsed < timeout:
-            try:
-                container.exec(["/app/bin/mmctl", "--local", "system", "status"]).wait_output()
-                return True
-            except ExecError:
-                time.sleep(poll_interval)
-                time_elapsed += poll_interval
+        with tracer.start_as_current_span("wait for local mode socket"):
+            while time_elapsed < timeout:
+                try:
+                    container.exec(["/app/bin/mmctl", "--local", "system", "status"]).wait_output()
+                    return True
+                except ExecError:
+                    time.sleep(poll_interval)
+                    time_elapsed += poll_interval
         return False
 
 
@@ -0,0 +1,228 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Caching proxy in front of Mattermost, for remote images and static assets."""
+
+import dataclasses
+import string
+
+# Port the caching proxy listens on, in front of Mattermost
+IMAGE_CACHE_PORT = 8081
+# Configuration of the caching proxy in the image-cache container
+IMAGE_CACHE_CONFIG_PATH = "/etc/nginx/nginx.conf"
+IMAGE_CACHE_SERVICE = "nginx"
+# Maximum size in megabytes of the cache of the webapp static assets
+STATIC_CACHE_MAX_SIZE = 512
+# Seconds browsers may keep thumbnails and previews, which are private to the user
+THUMBNAIL_MAX_AGE = 86400
+
+# Webapp assets with a content hash in their name, such as main.0a1b2c3d4e5f6a7b8c9d.js
+# or files/0a1b2c3d4e5f6a7b8c9d.svg, never change
+HASHED_ASSET_PATTERN = r"[./][0-9a-f]{8,}\.[a-z0-9]+$"
+
+NGINX_CONFIG = string.Template("""\
+worker_processes auto;
+pid /run/nginx.pid;
+error_log stderr warn;
+
+events {
+    worker_connections 4096;
+}
+
+http {
+    access_log off;
+    server_tokens off;
+    client_max_body_size 0;
+
+    map $$http_upgrade $$connection_upgrade {
+        default upgrade;
+        "" "";
+    }
+${http}
+    upstream mattermost {
+        server 127.0.0.1:${mattermost_port};
+        keepalive 32;
+    }
+
+    server {
+        listen ${port};
+
+        proxy_http_version 1.1;
+        proxy_set_header Host $$host;
+        proxy_set_header X-Real-IP $$remote_addr;
+        proxy_set_header X-Forwarded-For $$proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto $$http_x_forwarded_proto;
+
+        location / {
+            proxy_set_header Upgrade $$http_upgrade;
+            proxy_set_header Connection $$connection_upgrade;
+            proxy_request_buffering off;
+            proxy_read_timeout 600s;
+            proxy_pass http://mattermost;
+        }
+${server}    }
+}
+""")
+
+IMAGES_HTTP_CONFIG = string.Template("""
+    # Remote images proxied by Mattermost, keyed by URL, least recently used ones evicted
+    proxy_cache_path /var/cache/nginx/images levels=1:2 keys_zone=images:16m
+                     max_size=${max_size}m inactive=${ttl}s use_temp_path=off;
+
+    # Only images announcing a size up to the maximum object size are cached
+    map $$upstream_http_content_length $$image_cache_skip {
+        "~^(${max_object_size_pattern})$$" 0;
+        default 1;
+    }
+""")
+
+IMAGES_SERVER_CONFIG = string.Template("""
+        location = /api/v4/image {
+            auth_request /image-cache-auth;
+            proxy_set_header Connection "";
+            proxy_cache images;
+            proxy_cache_key $$arg_url;
+            proxy_cache_valid 200 ${ttl}s;
+            proxy_cache_lock on;
+            proxy_cache_use_stale error timeout updating;
+            proxy_ignore_headers Cache-Control Expires Set-Cookie Vary;
+            proxy_hide_header Set-Cookie;
+            proxy_no_cache $$image_cache_skip;
+            add_header X-Cache-Status $$upstream_cache_status always;
+            proxy_pass http://mattermost;
+        }
+
+        # The image proxy is only available to logged in users, cached or not
+        location = /image-cache-auth {
+            internal;
+            proxy_set_header Connection "";
+            proxy_set_header Content-Length "";
+            proxy_pass_request_body off;
+            proxy_pass http://mattermost/api/v4/users/me;
+        }
+""")
+
+STATIC_HTTP_CONFIG = string.Template("""
+    # Webapp assets, a few hundred files, cached as long as Mattermost allows
+    proxy_cache_path /var/cache/nginx/static levels=1:2 keys_zone=static:4m
+                     max_size=${static_max_size}m inactive=7d use_temp_path=off;
+
+    gzip on;
+    gzip_proxied any;
+    gzip_vary on;
+    gzip_min_length 1024;
+    gzip_types text/css text/plain application/javascript application/json
+               application/wasm image/svg+xml font/ttf;
+
+    # Cached assets are stored compressed or not, depending on the browser
+    map $$http_accept_encoding $$static_encoding {
+        "~*gzip" gzip;
+        default "";
+    }
+""")
+
+STATIC_SERVER_CONFIG = string.Template("""
+        location /static/ {
+            proxy_set_header Connection "";
+            proxy_set_header Accept-Encoding $$static_encoding;
+            proxy_cache static;
+            proxy_cache_key $$uri$$static_encoding;
+            proxy_cache_valid 200 7d;
+            proxy_cache_lock on;
+            proxy_cache_use_stale error timeout updating;
+            proxy_ignore_headers Set-Cookie;
+            proxy_hide_header Set-Cookie;
+            add_header X-Cache-Status $$upstream_cache_status always;
+            proxy_pass http://mattermost;
+
+            # Header directives of a nested location replace the ones of its parent
+            location ~ "${hashed_asset_pattern}" {
+                proxy_hide_header Set-Cookie;
+                proxy_hide_header Cache-Control;
+                add_header Cache-Control "public, max-age=31536000, immutable" always;
+                add_header X-Cache-Status $$upstream_cache_status always;
+                proxy_pass http://mattermost;
+            }
+        }
+
+        # Thumbnails and previews are cached by the browser only
+        location ~ ^/api/v4/files/[a-z0-9]+/(thumbnail|preview)$$ {
+            proxy_set_header Connection "";
+            proxy_hide_header Cache-Control;
+            add_header Cache-Control "private, max-age=${thumbnail_max_age}" always;
+            proxy_pass http://mattermost;
+        }
+""")
+
+
+@dataclasses.dataclass(frozen=True)
+class ImageCacheConfig:
+    """Bounds of the cache of the remote images served by the image proxy.
+
+    Attributes:
+        max_size: Maximum size of the cache in megabytes.
+        max_object_size: Maximum size of a cached image in megabytes.
+        ttl: Seconds an image is served from the cache before being fetched again.
+    """
+
+    max_size: int
+    max_object_size: int
+    ttl: int
+
+
+def max_integer_pattern(maximum: int) -> str:
+    """Get a regular expression matching the decimal integers up to a maximum.
+
+    nginx cannot compare numbers, the size of the responses is matched with this pattern
+    instead.
+
+    Args:
+        maximum: The largest integer matched.
+
+    Returns:
+        The regular expression, without anchors.
+    """
+    digits = str(maximum)
+    alternatives = [f"[0-9]{{1,{len(digits) - 1}}}"] if len(digits) > 1 else []
+    for index, digit in enumerate(digits):
+        # integers with several digits have no leading zero
+        lowest = 1 if index == 0 and len(digits) > 1 else 0
+        if int(digit) - 1 < lowest:
+            continue
+        remaining = len(digits) - index - 1
+        alternative = f"{digits[:index]}[{lowest}-{int(digit) - 1}]"
+        alternatives.append(alternative + (f"[0-9]{{{remaining}}}" if remaining else ""))
+    alternatives.append(digits)
+    return "|".join(alternatives)
+
+
+def render_nginx_config(
+    mattermost_port: int, images: ImageCacheConfig | None, static_assets: bool
+) -> str:
+    """Render the configuration of the caching proxy.
+
+    Args:
+        mattermost_port: Port Mattermost listens on.
+        images: Bounds of the cache of remote images, None to pass them through.
+        static_assets: Whether the webapp static assets are cached and compressed.
+
+    Returns:
+        The nginx configuration.
+    """
+    http = server = ""
+    if images:
+        images_config = {
+            "max_size": images.max_size,
+            "max_object_size_pattern": max_integer_pattern(images.max_object_size * 1024 * 1024),
+            "ttl": images.ttl,
+        }
+        http += IMAGES_HTTP_CONFIG.substitute(images_config)
+        server += IMAGES_SERVER_CONFIG.substitute(images_config)
+    if static_assets:
+        http += STATIC_HTTP_CONFIG.substitute(static_max_size=STATIC_CACHE_MAX_SIZE)
+        server += STATIC_SERVER_CONFIG.substitute(
+            hashed_asset_pattern=HASHED_ASSET_PATTERN, thumbnail_max_age=THUMBNAIL_MAX_AGE
+        )
+    return NGINX_CONFIG.substitute(
+        port=IMAGE_CACHE_PORT, mattermost_port=mattermost_port, http=http, server=server
+    )
@@ -0,0 +1,193 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mattermost workload environment."""
+
+import typing
+
+from paas_charm.app import App, generate_db_env
+from paas_charm.exceptions import CharmConfigInvalidError
+
+if typing.TYPE_CHECKING:
+    from charms.data_platform_libs.v0.data_interfaces import OpenSearchRequires
+    from paas_charm.databases import PaaSDatabaseRelationData, PaaSDatabaseRequires
+    from paas_charm.s3 import PaaSS3RelationData
+
+# Values of the database-pooler configuration option
+DATABASE_POOLERS = ("auto", "pgbouncer", "none")
+# Port PgBouncer listens on by default
+PGBOUNCER_PORT = "6432"
+# Name of the rclone remote of the s3 integration, configured from the environment
+RCLONE_S3_REMOTE = "mattermost-s3"
+
+
+def check_database_pooler(pooler: str) -> None:
+    """Check the database-pooler configuration option.
+
+    Args:
+        pooler: The database-pooler configuration option.
+
+    Raises:
+        CharmConfigInvalidError: If the configuration option is not a known pooler.
+    """
+    if pooler not in DATABASE_POOLERS:
+        raise CharmConfigInvalidError(
+            f"invalid database-pooler {pooler!r}, expected one of {', '.join(DATABASE_POOLERS)}"
+        )
+
+
+def get_postgresql_pooler(requirer: "PaaSDatabaseRequires", pooler: str) -> str | None:
+    """Get the connection pooler between Mattermost and PostgreSQL.
+
+    With "auto", a pgbouncer charm is detected from the name of the application on the other
+    side of the postgresql relation or from its endpoints using the PgBouncer port.
+
+    Args:
+        requirer: The postgresql database requirer.
+        pooler: The database-pooler configuration option.
+
+    Raises:
+        CharmConfigInvalidError: If the configuration option is not a known pooler.
+
+    Returns:
+        "pgbouncer" if Mattermost connects through PgBouncer, None otherwise.
+    """
+    check_database_pooler(pooler)
+    if pooler != "auto":
+        return pooler if pooler == "pgbouncer" else None
+    for relation in requirer.relations:
+        if relation.app and "pgbouncer" in relation.app.name:
+            return "pgbouncer"
+    for data in requirer.fetch_relation_data(fields=["endpoints"]).values():
+        hosts = data.get("endpoints", "").split(",")
+        if any(host.strip().rpartition(":")[2] == PGBOUNCER_PORT for host in hosts):
+            return "pgbouncer"
+    return None
+
+
+def get_opensearch_environment(requirer: "OpenSearchRequires") -> dict[str, str]:
+    """Get the environment variables to connect to OpenSearch.
+
+    Mattermost connects to a single URL, the first endpoint in a stable order is used.
+
+    Args:
+        requirer: The opensearch requirer.
+
+    Returns:
+        The OpenSearch environment variables, empty if the index is not ready yet.
+    """
+    fields = ["endpoints", "username", "password", "tls", "tls-ca"]
+    for data in requirer.fetch_relation_data(fields=fields).values():
+        endpoints = sorted(
+            host.strip() for host in data.get("endpoints", "").split(",") if host.strip()
+        )
+        if not endpoints or not data.get("username"):
+            continue
+        scheme = "https" if data.get("tls-ca") or data.get("tls") == "True" else "http"
+        env = {
+            "OPENSEARCH_URL": f"{scheme}://{endpoints[0]}",
+            "OPENSEARCH_USERNAME": data["username"],
+            "OPENSEARCH_PASSWORD": data.get("password", ""),
+            "OPENSEARCH_INDEX_PREFIX": f"{requirer.index}_",
+        }
+        if data.get("tls-ca"):
+            env["OPENSEARCH_CA"] = data["tls-ca"]
+        return env
+    return {}
+
+
+def get_rclone_s3_environment(s3: "PaaSS3RelationData") -> dict[str, str]:
+    """Get the environment variables configuring the rclone remote of the S3 bucket.
+
+    Args:
+        s3: The s3 relation data.
+
+    Returns:
+        The rclone environment variables.
+    """
+    prefix = f"RCLONE_CONFIG_{RCLONE_S3_REMOTE.upper().replace('-', '_')}_"
+    env = {
+        "TYPE": "s3",
+        "PROVIDER": "Other",
+        "ACCESS_KEY_ID": s3.access_key,
+        "SECRET_ACCESS_KEY": s3.secret_key,
+        "FORCE_PATH_STYLE": str(s3.addressing_style != "virtual").lower(),
+    }
+    if s3.region:
+        env["REGION"] = s3.region
+    if s3.endpoint:
+        env["ENDPOINT"] = s3.endpoint
+    if s3.storage_class:
+        env["STORAGE_CLASS"] = s3.storage_class
+    return {prefix + key: value for key, value in env.items()}
+
+
+def get_rclone_s3_destination(s3: "PaaSS3RelationData") -> str:
+    """Get the rclone destination where Mattermost stores its files in the S3 bucket.
+
+    Args:
+        s3: The s3 relation data.
+
+    Returns:
+        The rclone remote path, with the path prefix Mattermost is configured with.
+    """
+    path = (s3.path or "").strip("/")
+    return f"{RCLONE_S3_REMOTE}:{s3.bucket}/{path}".rstrip("/")
+
+
+class MattermostApp(App):
+    """Mattermost application manager.
+
+    The workload is told about the connection pooler between Mattermost and PostgreSQL, if
+    any, so that the connection string is rendered with the options it requires.
+    """
+
+    def __init__(
+        self,
+        *,
+        postgresql_pooler: str | None = None,
+        opensearch_env: dict[str, str] | None = None,
+        **kwargs: typing.Any,
+    ) -> None:
+        """Construct the MattermostApp instance.
+
+        Args:
+            postgresql_pooler: Connection pooler between Mattermost and PostgreSQL.
+            opensearch_env: Environment variables to connect to OpenSearch.
+            kwargs: Passed through to App.
+        """
+        super().__init__(**kwargs)
+        self._postgresql_pooler = postgresql_pooler
+        self._opensearch_env = opensearch_env or {}
+
+    def gen_environment(self) -> dict[str, str]:
+        """Generate the environment of the workload, including the integrations of the charm.
+
+        Returns:
+            A dictionary representing the application environment variables.
+        """
+        env = super().gen_environment()
+        env.update(self._opensearch_env)
+        return env
+
+    def generate_db_env(  # type: ignore[override]
+        self, database_name: str, relation_data: "PaaSDatabaseRelationData | None" = None
+    ) -> dict[str, str]:
+        """Generate environment variables from Database relation data.
+
+        For PostgreSQL, the connection pooler, if any, is added. The connection string names
+        the primary endpoint of the relation, a service which follows the primary after a
+        failover, so a failover does not change the environment.
+
+        Args:
+            database_name: The name of the database, i.e. postgresql.
+            relation_data: The charm database integration relation data.
+
+        Returns:
+            Database environment mappings if relation data is available, empty dictionary
+            otherwise.
+        """
+        env = generate_db_env(database_name, relation_data)
+        if database_name == "postgresql" and env and self._postgresql_pooler:
+            env["POSTGRESQL_DB_POOLER"] = self._postgresql_pooler
+        return env
@@ -13,5 +13,6 @@ output "requires" {
     smtp       = "smtp"
     oauth      = "oauth"
     ingress    = "ingress"
+    opensearch = "opensearch"
   }
 }
@@ -43,7 +43,7 @@ variable "revision" {
 }
 
 variable "storage" {
-  description = "Map of storage used by the application."
+  description = "Map of storage used by the application, e.g. { file-store = \"fast,100G\" } to select a storage pool."
   type        = map(string)
   default     = {}
 }
@@ -0,0 +1,21 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Fixtures for the charm benchmarks."""
+
+import json
+import pathlib
+import typing
+
+import pytest
+
+BASELINE_PATH = pathlib.Path(__file__).parent / "baseline.json"
+
+
+@pytest.fixture(scope="session", name="baseline")
+def baseline_fixture(request: pytest.FixtureRequest) -> typing.Iterator[dict[str, dict]]:
+    """Load the recorded baseline and write it back when updating it."""
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    yield baseline
+    if request.config.getoption("--update-benchmark-baseline"):
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
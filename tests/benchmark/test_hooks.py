@@ -0,0 +1,301 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# Learn more about testing at: https://ops.readthedocs.io/en/latest/explanation/testing.html
+
+"""Benchmarks for the wall time and memory allocations of the charm hooks."""
+
+import json
+import logging
+import time
+import tracemalloc
+import typing
+
+import ops
+import ops.testing
+import pytest
+
+# The metadata of the unit tests, whose package is importable from the tests rootdir
+from unit.test_base import CHARM_ACTIONS, CHARM_CONFIG, CHARM_META
+
+from charm import MattermostK8sCharm
+
+# Number of timed runs per hook. The fastest run is compared against the baseline as it is
+# the least affected by the noise of the machine running the benchmarks.
+ROUNDS = 10
+# Number of padding keys (and the size of each value) added to the remote databags
+# to reproduce the large relation data seen in production.
+DATABAG_PADDING_KEYS = 200
+DATABAG_PADDING_SIZE = 1024
+
+# The workload service declared by the Mattermost rock.
+ROCK_SERVICE: ops.pebble.ServiceDict = {
+    "override": "replace",
+    "command": "bash /app/start.sh",
+    "startup": "enabled",
+    "working-dir": "/app",
+    "user": "_daemon_",
+}
+
+
+def _padding() -> dict[str, str]:
+    """Build the extra keys added to the remote databags.
+
+    Returns:
+        Padding relation data.
+    """
+    return {f"extra-{i}": "x" * DATABAG_PADDING_SIZE for i in range(DATABAG_PADDING_KEYS)}
+
+
+def _postgresql_relation() -> ops.testing.Relation:
+    """Build a postgresql relation with a large remote databag.
+
+    Returns:
+        The postgresql relation.
+    """
+    return ops.testing.Relation(
+        endpoint="postgresql",
+        remote_app_name="postgresql-k8s",
+        remote_app_data={
+            "database": "mattermost-k8s",
+            "endpoints": "postgresql-k8s-primary.model.svc.cluster.local:5432",
+            "username": "relation_id_1",
+            "password": "postgresql-password",
+            "version": "14.12",
+            **_padding(),
+        },
+    )
+
+
+def _s3_relation() -> ops.testing.Relation:
+    """Build a s3 relation with a large remote databag.
+
+    Returns:
+        The s3 relation.
+    """
+    return ops.testing.Relation(
+        endpoint="s3",
+        remote_app_name="s3-integrator",
+        remote_app_data={
+            "access-key": "s3-access-key",
+            "secret-key": "s3-secret-key",
+            "bucket": "mattermost-k8s",
+            "endpoint": "https://radosgw.example.com",
+            "region": "us-east-1",
+            "path": "/mattermost",
+            **_padding(),
+        },
+    )
+
+
+def _smtp_relation() -> ops.testing.Relation:
+    """Build a smtp relation with a large remote databag.
+
+    Returns:
+        The smtp relation.
+    """
+    return ops.testing.Relation(
+        endpoint="smtp",
+        remote_app_name="smtp-integrator",
+        remote_app_data={
+            "host": "smtp.example.com",
+            "port": "587",
+            "user": "mattermost",
+            "password": "smtp-password",
+            "auth_type": "plain",
+            "transport_security": "starttls",
+            "domain": "example.com",
+            **_padding(),
+        },
+    )
+
+
+def _oauth_relation() -> tuple[ops.testing.Relation, ops.testing.Secret]:
+    """Build an oauth relation with a large remote databag and its client secret.
+
+    Returns:
+        The oauth relation and the secret holding the client secret.
+    """
+    client_secret = ops.testing.Secret(
+        tracked_content={"secret": "oauth-client-secret"}, owner=None
+    )
+    relation = ops.testing.Relation(
+        endpoint="oauth",
+        remote_app_name="hydra",
+        remote_app_data={
+            "issuer_url": "https://hydra.example.com",
+            "authorization_endpoint": "https://hydra.example.com/oauth2/auth",
+            "token_endpoint": "https://hydra.example.com/oauth2/token",
+            "introspection_endpoint": "https://hydra.example.com/admin/oauth2/introspect",
+            "userinfo_endpoint": "https://hydra.example.com/userinfo",
+            "jwks_endpoint": "https://hydra.example.com/.well-known/jwks.json",
+            "scope": "openid profile email",
+            "client_id": "mattermost-client-id",
+            "client_secret_id": client_secret.id,
+            **_padding(),
+        },
+    )
+    return relation, client_secret
+
+
+def _base_state(**kwargs: typing.Any) -> ops.testing.State:
+    """Build a state with the ready containers, the peer relation and postgresql.
+
+    Args:
+        kwargs: extra relations and secrets to add to the state.
+
+    Returns:
+        The hook input state.
+    """
+    container = ops.testing.Container(
+        name="app",
+        can_connect=True,
+        layers={"rock": ops.pebble.Layer({"services": {"go": ROCK_SERVICE}})},
+    )
+    image_cache = ops.testing.Container(name="image-cache", can_connect=True)
+    peer = ops.testing.PeerRelation(
+        endpoint="secret-storage",
+        local_app_data={"go_secret_key": "test-secret-key"},
+    )
+    relations = {peer, *kwargs.get("relations", ())}
+    if not any(relation.endpoint == "postgresql" for relation in relations):
+        relations.add(_postgresql_relation())
+    return ops.testing.State(
+        leader=True,
+        containers={container, image_cache},
+        relations=relations,
+        secrets=set(kwargs.get("secrets", ())),
+    )
+
+
+def _config_changed(context: ops.testing.Context) -> tuple[typing.Any, ops.testing.State]:
+    """Build the config-changed benchmark case."""
+    return context.on.config_changed(), _base_state()
+
+
+def _pebble_ready(context: ops.testing.Context) -> tuple[typing.Any, ops.testing.State]:
+    """Build the pebble-ready benchmark case."""
+    state = _base_state()
+    return context.on.pebble_ready(state.get_container("app")), state
+
+
+def _update_status(context: ops.testing.Context) -> tuple[typing.Any, ops.testing.State]:
+    """Build the update-status benchmark case."""
+    return context.on.update_status(), _base_state()
+
+
+def _postgresql_changed(context: ops.testing.Context) -> tuple[typing.Any, ops.testing.State]:
+    """Build the postgresql relation-changed benchmark case."""
+    relation = _postgresql_relation()
+    return context.on.relation_changed(relation), _base_state(relations=[relation])
+
+
+def _s3_changed(context: ops.testing.Context) -> tuple[typing.Any, ops.testing.State]:
+    """Build the s3 relation-changed benchmark case."""
+    relation = _s3_relation()
+    return context.on.relation_changed(relation), _base_state(relations=[relation])
+
+
+def _smtp_changed(context: ops.testing.Context) -> tuple[typing.Any, ops.testing.State]:
+    """Build the smtp relation-changed benchmark case."""
+    relation = _smtp_relation()
+    return context.on.relation_changed(relation), _base_state(relations=[relation])
+
+
+def _oauth_changed(context: ops.testing.Context) -> tuple[typing.Any, ops.testing.State]:
+    """Build the oauth relation-changed benchmark case."""
+    relation, secret = _oauth_relation()
+    # OIDC requires the ingress to be ready before the workload is restarted.
+    ingress = ops.testing.Relation(
+        endpoint="ingress",
+        remote_app_name="traefik-k8s",
+        remote_app_data={"ingress": json.dumps({"url": "https://mattermost.example.com/"})},
+    )
+    return context.on.relation_changed(relation), _base_state(
+        relations=[relation, ingress], secrets=[secret]
+    )
+
+
+HOOKS = {
+    "config-changed": _config_changed,
+    "pebble-ready": _pebble_ready,
+    "update-status": _update_status,
+    "postgresql-relation-changed": _postgresql_changed,
+    "s3-relation-changed": _s3_changed,
+    "smtp-relation-changed": _smtp_changed,
+    "oauth-relation-changed": _oauth_changed,
+}
+
+
+def _measure(
+    build_case: typing.Callable[[ops.testing.Context], tuple[typing.Any, ops.testing.State]],
+) -> dict[str, float]:
+    """Measure the fastest wall time and the peak allocated memory of a hook.
+
+    Args:
+        build_case: builder of the event and the input state of the hook.
+
+    Returns:
+        The fastest wall time in seconds and the peak allocated memory in bytes.
+    """
+
+    def run() -> None:
+        context = ops.testing.Context(
+            charm_type=MattermostK8sCharm,
+            meta=CHARM_META,
+            actions=CHARM_ACTIONS,
+            config=CHARM_CONFIG,
+        )
+        event, state = build_case(context)
+        # Each run installs a Juju log handler on the root logger, remove it afterwards
+        # so that later runs are not slowed down by the handlers of the previous ones.
+        root_logger = logging.getLogger()
+        handlers = list(root_logger.handlers)
+        try:
+            context.run(event, state)
+        finally:
+            root_logger.handlers = handlers
+
+    # The first run pays for the imports and the caches of the libraries.
+    run()
+    durations = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - start)
+
+    # Memory is traced in a separate run as tracing allocations slows the hook down.
+    tracemalloc.start()
+    try:
+        run()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"wall_time": min(durations), "peak_memory": peak_memory}
+
+
+@pytest.mark.parametrize("hook", HOOKS.keys())
+def test_hook_cost(hook: str, baseline: dict[str, dict], request: pytest.FixtureRequest):
+    """
+    arrange: A state with the container ready and, for relation hooks, a large remote databag.
+    act: Run the hook several times, then once more while tracing memory allocations.
+    assert: The fastest wall time and the peak memory do not exceed the recorded baseline by
+        more than their allowed thresholds.
+    """
+    result = _measure(HOOKS[hook])
+
+    if request.config.getoption("--update-benchmark-baseline"):
+        baseline[hook] = result
+        return
+
+    if hook not in baseline:
+        pytest.fail(f"No baseline recorded for {hook}, run with --update-benchmark-baseline")
+    # Wall time depends on the load of the machine, allocations do not.
+    thresholds = {
+        "wall_time": float(request.config.getoption("--benchmark-time-threshold")),
+        "peak_memory": float(request.config.getoption("--benchmark-memory-threshold")),
+    }
+    for metric, value in result.items():
+        limit = baseline[hook][metric] * (1 + thresholds[metric])
+        assert value <= limit, f"{hook} {metric} regressed: {value} > {limit}"
@@ -0,0 +1,61 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# Learn more about testing at: https://ops.readthedocs.io/en/latest/explanation/testing.html
+
+"""Benchmark for the import time of the charm entrypoint."""
+
+import os
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+# Number of timed imports. The fastest one is compared against the baseline, as for the hooks.
+ROUNDS = 5
+ROOT = pathlib.Path(__file__).parents[2]
+
+
+def _import_charm() -> dict[str, int]:
+    """Import the charm entrypoint in a new interpreter with `-X importtime`.
+
+    Returns:
+        The cumulative import time in microseconds of each imported module.
+    """
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(ROOT / "lib"), str(ROOT / "src")])}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import charm"],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    cumulative_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.removeprefix("import time:").split("|")
+        cumulative_times[module.strip()] = int(cumulative)
+    return cumulative_times
+
+
+def test_charm_import_time(baseline: dict[str, dict], request: pytest.FixtureRequest):
+    """
+    arrange: A new Python interpreter, after a first import has compiled the bytecode.
+    act: Import the charm entrypoint several times with `python -X importtime`.
+    assert: The fastest cumulative import time of the charm module does not exceed the
+        recorded baseline by more than the allowed wall time threshold.
+    """
+    _import_charm()
+    import_time = min(_import_charm()["charm"] for _ in range(ROUNDS))
+
+    if request.config.getoption("--update-benchmark-baseline"):
+        baseline["charm-import"] = {"import_time": import_time}
+        return
+
+    if "charm-import" not in baseline:
+        pytest.fail("No baseline recorded for charm-import, run with --update-benchmark-baseline")
+    threshold = float(request.config.getoption("--benchmark-time-threshold"))
+    limit = baseline["charm-import"]["import_time"] * (1 + threshold)
+    assert import_time <= limit, f"charm import_time regressed: {import_time}us > {limit}us"
@@ -34,3 +34,26 @@ def pytest_addoption(parser):
         help="mattermost OCI rock image URI",
     )
     parser.addoption("--s3-address", action="store")
+    parser.addoption(
+        "--mattermost-licence",
+        action="store",
+        help="path to a Mattermost Enterprise Edition licence file",
+    )
+    parser.addoption(
+        "--update-benchmark-baseline",
+        action="store_true",
+        default=False,
+        help="record the benchmark results as the new baseline",
+    )
+    parser.addoption(
+        "--benchmark-time-threshold",
+        action="store",
+        default="1.0",
+        help="allowed wall time regression over the benchmark baseline, as a fraction",
+    )
+    parser.addoption(
+        "--benchmark-memory-threshold",
+        action="store",
+        default="0.2",
+        help="allowed peak memory regression over the benchmark baseline, as a fraction",
+    )
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Benchmarks for the attachment throughput of Mattermost on S3.
+
+The S3 stand-in is the MicroCeph radosgw started on the runner by s3-installation.sh.
+Cases without a recorded baseline in s3_baseline.json are skipped unless it is being
+recorded, and the SSE variant is skipped without an Enterprise Edition licence.
+"""
+
+import json
+import logging
+import pathlib
+import random
+import time
+import typing
+
+import jubilant
+import pytest
+import requests
+
+from ..conftest import JUJU_WAIT_TIMEOUT, MATTERMOST_PORT, generate_s3_config
+
+logger = logging.getLogger(__name__)
+
+BASELINE_PATH = pathlib.Path(__file__).parent / "s3_baseline.json"
+# Number of timed uploads and downloads per case. The fastest one is compared against the
+# baseline as it is the least affected by the noise of the runner.
+ROUNDS = 3
+KIB = 1024
+MIB = 1024 * KIB
+# Attachment sizes, from a small image to a large video.
+SIZES = {
+    "10KiB": 10 * KIB,
+    "1MiB": MIB,
+    "10MiB": 10 * MIB,
+    "100MiB": 100 * MIB,
+    "500MiB": 500 * MIB,
+}
+# Configuration shared by all variants, max-file-size allows the largest attachment. The
+# shortest restart window is waited for by the hooks, so restarts are never postponed.
+# Only the variants needing it run with the licence, the others are unlicensed.
+BASE_CONFIG = {
+    "restart-coalesce-window": 10,
+    "licence": "",
+    "max-file-size": 600,
+    "s3-server-side-encryption": False,
+    "debug": False,
+    "s3-upload-part-size": 5,
+}
+VARIANTS: dict[str, dict[str, typing.Any]] = {
+    "default": {},
+    "sse": {"s3-server-side-encryption": True},
+    "trace": {"debug": True},
+    "part-size-16": {"s3-upload-part-size": 16},
+    "part-size-64": {"s3-upload-part-size": 64},
+}
+# Variants using Enterprise Edition features, which Mattermost ignores without a licence.
+LICENSED_VARIANTS = {"sse"}
+USER = {
+    "email": "s3benchmark@test.local",
+    "username": "s3benchmark",
+    "password": "S3BenchmarkPassword123!",
+}
+
+
+def _address(app: str, juju: jubilant.Juju) -> str:
+    """Get a fresh Mattermost address from Juju status."""
+    status = juju.status()
+    address = status.apps[app].address or status.apps[app].units[app + "/0"].address
+    return f"http://{address}:{MATTERMOST_PORT}"
+
+
+def _expected_file_settings(config: dict[str, typing.Any]) -> dict[str, typing.Any]:
+    """Get the Mattermost file settings a benchmark configuration results in.
+
+    Args:
+        config: charm configuration of the variant.
+
+    Returns:
+        The expected subset of FileSettings.
+    """
+    return {
+        "DriverName": "amazons3",
+        "AmazonS3SSE": config["s3-server-side-encryption"],
+        "AmazonS3Trace": config["debug"],
+        "AmazonS3UploadPartSizeBytes": config["s3-upload-part-size"] * MIB,
+    }
+
+
+@pytest.fixture(scope="module", name="session")
+def session_fixture(app: str, juju: jubilant.Juju, s3_address: str | None) -> requests.Session:
+    """Integrate Mattermost with radosgw and log in as a system admin.
+
+    Returns:
+        A session authenticated to the Mattermost API.
+    """
+    if not s3_address:
+        pytest.skip("requires --s3-address argument or reachable host IP")
+    s3_conf = generate_s3_config(s3_address)
+    if "s3-integrator" not in juju.status().apps:
+        juju.deploy(
+            "s3-integrator",
+            channel="latest/edge",
+            config={key: s3_conf[key] for key in ("endpoint", "bucket", "path", "region")},
+        )
+        juju.wait(lambda status: jubilant.all_blocked(status, "s3-integrator"))
+        juju.run(
+            "s3-integrator/0",
+            "sync-s3-credentials",
+            {"access-key": s3_conf["access-key"], "secret-key": s3_conf["secret-key"]},
+        )
+        juju.integrate(app, "s3-integrator")
+    juju.wait(jubilant.all_active, timeout=JUJU_WAIT_TIMEOUT)
+
+    address = _address(app, juju)
+    session = requests.Session()
+    # The user already exists when the model is reused
+    requests.post(f"{address}/api/v4/users", json=USER, timeout=30)
+    juju.run(f"{app}/0", "grant-admin-role", {"user": USER["username"]})
+    response = session.post(
+        f"{address}/api/v4/users/login",
+        json={"login_id": USER["username"], "password": USER["password"]},
+        timeout=30,
+    )
+    assert response.status_code == 200, f"Failed to log in: {response.text}"
+    session.headers["Authorization"] = f"Bearer {response.headers['Token']}"
+    return session
+
+
+@pytest.fixture(scope="module", name="channel_id")
+def channel_id_fixture(app: str, juju: jubilant.Juju, session: requests.Session) -> str:
+    """Get a channel to attach the benchmark files to."""
+    address = _address(app, juju)
+    response = session.get(f"{address}/api/v4/teams/name/s3benchmark", timeout=30)
+    if response.status_code != 200:
+        response = session.post(
+            f"{address}/api/v4/teams",
+            json={"name": "s3benchmark", "display_name": "S3 Benchmark", "type": "O"},
+            timeout=30,
+        )
+        assert response.status_code == 201, f"Failed to create team: {response.text}"
+    team_id = response.json()["id"]
+    response = session.get(
+        f"{address}/api/v4/teams/{team_id}/channels/name/town-square", timeout=30
+    )
+    assert response.status_code == 200, f"Failed to get channel: {response.text}"
+    return response.json()["id"]
+
+
+@pytest.fixture(scope="module", name="licence")
+def licence_fixture(pytestconfig: pytest.Config) -> str | None:
+    """Read the Enterprise Edition licence given with --mattermost-licence."""
+    path = pytestconfig.getoption("--mattermost-licence")
+    return pathlib.Path(path).read_text(encoding="utf-8") if path else None
+
+
+@pytest.fixture(scope="module", name="baseline")
+def baseline_fixture(request: pytest.FixtureRequest) -> typing.Iterator[dict[str, dict]]:
+    """Load the recorded baseline and write it back when updating it."""
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    yield baseline
+    if request.config.getoption("--update-benchmark-baseline"):
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+
+
+def _configure(
+    app: str, juju: jubilant.Juju, session: requests.Session, config: dict[str, typing.Any]
+) -> None:
+    """Configure Mattermost and wait until the workload applies the configuration.
+
+    Args:
+        app: Mattermost application name.
+        juju: the Juju object.
+        session: authenticated Mattermost API session.
+        config: charm configuration of the variant.
+    """
+    juju.config(app, config)
+    juju.wait(jubilant.all_active, timeout=JUJU_WAIT_TIMEOUT)
+    response = session.get(f"{_address(app, juju)}/api/v4/config", timeout=30)
+    assert response.status_code == 200, f"Failed to get the configuration: {response.text}"
+    settings = response.json()["FileSettings"]
+    for key, value in _expected_file_settings(config).items():
+        assert settings[key] == value, f"{key} is {settings[key]}, expected {value}"
+
+
+def _measure(address: str, session: requests.Session, channel_id: str, size: int) -> dict:
+    """Measure the fastest upload and download of an attachment through the files API.
+
+    Args:
+        address: Mattermost address.
+        session: authenticated Mattermost API session.
+        channel_id: channel the attachment is uploaded to.
+        size: attachment size in bytes.
+
+    Returns:
+        The fastest latencies in seconds and the matching throughputs in bytes per second.
+    """
+    # Random content, so that neither Mattermost nor radosgw can compress it
+    content = random.Random(size).randbytes(size)
+    uploads, downloads = [], []
+    for round_ in range(ROUNDS):
+        start = time.perf_counter()
+        response = session.post(
+            f"{address}/api/v4/files",
+            files={"files": (f"benchmark-{size}-{round_}.bin", content)},
+            data={"channel_id": channel_id},
+            timeout=600,
+        )
+        uploads.append(time.perf_counter() - start)
+        assert response.status_code == 201, f"Failed to upload file: {response.text}"
+        file_id = response.json()["file_infos"][0]["id"]
+
+        start = time.perf_counter()
+        response = session.get(f"{address}/api/v4/files/{file_id}", timeout=600)
+        downloads.append(time.perf_counter() - start)
+        assert response.status_code == 200, f"Failed to download file: {response.text}"
+        assert len(response.content) == size
+
+    upload_latency, download_latency = min(uploads), min(downloads)
+    return {
+        "upload_latency": upload_latency,
+        "download_latency": download_latency,
+        "upload_throughput": size / upload_latency,
+        "download_throughput": size / download_latency,
+    }
+
+
+@pytest.mark.parametrize(
+    "variant, size",
+    [
+        pytest.param(variant, size, id=f"{variant}-{size}")
+        for variant in VARIANTS
+        for size in SIZES
+    ],
+)
+def test_s3_attachment_throughput(
+    variant: str,
+    size: str,
+    app: str,
+    juju: jubilant.Juju,
+    session: requests.Session,
+    channel_id: str,
+    baseline: dict[str, dict],
+    licence: str | None,
+    request: pytest.FixtureRequest,
+):
+    """Check the attachment throughput of Mattermost on S3 against the baseline.
+
+    arrange: Mattermost integrated with radosgw and configured for the variant.
+    act: Upload and download an attachment of the given size several times.
+    assert: The fastest upload and download latencies do not exceed the recorded baseline
+        by more than the allowed threshold.
+    """
+    case = f"{variant}/{size}"
+    updating = request.config.getoption("--update-benchmark-baseline")
+    if not updating and case not in baseline:
+        pytest.skip(f"No baseline recorded for {case}, run with --update-benchmark-baseline")
+    config = {**BASE_CONFIG, **VARIANTS[variant]}
+    if variant in LICENSED_VARIANTS:
+        if not licence:
+            pytest.skip(f"{variant} requires --mattermost-licence argument")
+        config["licence"] = licence
+    _configure(app, juju, session, config)
+    result = _measure(_address(app, juju), session, channel_id, SIZES[size])
+    logger.info(
+        "%s: upload %.1f MiB/s, download %.1f MiB/s",
+        case,
+        result["upload_throughput"] / MIB,
+        result["download_throughput"] / MIB,
+    )
+
+    if updating:
+        baseline[case] = result
+        return
+
+    threshold = float(request.config.getoption("--benchmark-time-threshold"))
+    for metric in ("upload_latency", "download_latency"):
+        limit = baseline[case][metric] * (1 + threshold)
+        assert result[metric] <= limit, f"{case} {metric} regressed: {result[metric]} > {limit}"
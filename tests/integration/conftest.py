@@ -4,12 +4,14 @@
 """Fixtures for charm integration tests."""
 
 import logging
+import pathlib
 import socket
 import typing
 from collections.abc import Generator
 
 import jubilant
 import pytest
+import yaml
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +24,10 @@ MATTERMOST_PORT = 8080
 
 APP_NAME = "mattermost-k8s"
 
+CHARMCRAFT = yaml.safe_load(
+    (pathlib.Path(__file__).parents[2] / "charmcraft.yaml").read_text(encoding="utf-8")
+)
+
 
 @pytest.fixture(scope="session", name="charm")
 def charm_fixture(pytestconfig: pytest.Config):
@@ -40,7 +46,11 @@ def charm_resources(pytestconfig: pytest.Config) -> dict[str, str]:
     if not rock_image_uri:
         pytest.fail("--mattermost-image must be set")
 
-    return {"app-image": rock_image_uri}
+    # the sidecar images are deployed from their upstream source, as from Charmhub
+    return {
+        "app-image": rock_image_uri,
+        "image-cache-image": CHARMCRAFT["resources"]["image-cache-image"]["upstream-source"],
+    }
 
 
 @pytest.fixture(scope="session", name="juju")
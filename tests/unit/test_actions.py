@@ -5,6 +5,8 @@
 
 """Unit tests for actions."""
 
+import json
+import pathlib
 from secrets import token_hex
 from unittest.mock import MagicMock, patch
 
@@ -16,22 +18,38 @@ from charm import MattermostK8sCharm
 
 SOCKET_PATH = "/var/tmp/mattermost_local.socket"
 
-# Metadata from the go-framework extension (charmcraft expand-extensions).
-# Needed because Scenario cannot expand charmcraft extensions automatically.
+# Metadata from charmcraft.yaml, which expands the go-framework extension.
 CHARM_META = {
     "name": "mattermost-k8s",
-    "containers": {"app": {"resource": "app-image"}},
+    "containers": {
+        "app": {
+            "resource": "app-image",
+            "mounts": [
+                {"storage": "file-store", "location": "/app/data"},
+            ],
+        },
+        "image-cache": {"resource": "image-cache-image"},
+    },
     "peers": {"secret-storage": {"interface": "secret-storage"}},
     "requires": {
         "postgresql": {"interface": "postgresql_client", "optional": False, "limit": 1},
+        "s3": {"interface": "s3", "optional": True, "limit": 1},
         "logging": {"interface": "loki_push_api"},
         "ingress": {"interface": "ingress", "limit": 1},
+        "charm-tracing": {"interface": "tracing", "optional": True, "limit": 1},
+        "opensearch": {"interface": "opensearch_client", "optional": True, "limit": 1},
     },
     "provides": {
         "metrics-endpoint": {"interface": "prometheus_scrape"},
         "grafana-dashboard": {"interface": "grafana_dashboard"},
     },
-    "resources": {"app-image": {"type": "oci-image"}},
+    "resources": {
+        "app-image": {"type": "oci-image"},
+        "image-cache-image": {"type": "oci-image"},
+    },
+    "storage": {
+        "file-store": {"type": "filesystem"},
+    },
 }
 
 CHARM_ACTIONS = {
@@ -40,6 +58,18 @@ CHARM_ACTIONS = {
         "params": {"user": {"type": "string"}},
     },
     "rotate-secret-key": {"description": "Rotate the secret key."},
+    "reindex-search": {
+        "description": "Start a full reindex of the OpenSearch indexes.",
+        "params": {"timeout": {"type": "integer", "default": 3600}},
+    },
+    "migrate-files-to-s3": {
+        "description": "Upload the files of the local file store to S3.",
+        "params": {
+            "transfers": {"type": "integer", "default": 4},
+            "upload-concurrency": {"type": "integer", "default": 4},
+            "chunk-size": {"type": "integer", "default": 16},
+        },
+    },
 }
 
 CHARM_CONFIG = {
@@ -106,10 +136,7 @@ def test_grant_admin_role_success(context: ops.testing.Context) -> None:
     action_event = context.on.action("grant-admin-role", params={"user": user})
     state_out = context.run(action_event, state_in)
 
-    assert (
-        context.action_results["output"]
-        == f"Successfully granted admin role to user {user}"
-    )
+    assert context.action_results["output"] == f"Successfully granted admin role to user {user}"
     plan = state_out.get_container("app").plan
     env = plan.services["go"].environment
     assert env["MM_SERVICESETTINGS_ENABLELOCALMODE"] == "false"
@@ -152,7 +179,9 @@ def test_grant_admin_role_exec_error(context: ops.testing.Context) -> None:
 
 
 @patch("time.sleep", return_value=None)
-def test_grant_admin_role_socket_timeout(mock_sleep: MagicMock, context: ops.testing.Context) -> None:
+def test_grant_admin_role_socket_timeout(
+    mock_sleep: MagicMock, context: ops.testing.Context
+) -> None:
     """Test that the action fails if the socket does not initialize within the timeout period.
 
     arrange: Mock the socket check to always fail and set up the container and action
@@ -165,17 +194,274 @@ def test_grant_admin_role_socket_timeout(mock_sleep: MagicMock, context: ops.tes
     mock_socket_fail = ops.testing.Exec(
         command_prefix=["/app/bin/mmctl", "--local", "system", "status"], return_code=1
     )
-    container = ops.testing.Container(
-        name="app", can_connect=True, execs=[mock_socket_fail]
-    )
+    container = ops.testing.Container(name="app", can_connect=True, execs=[mock_socket_fail])
     state_in = ops.testing.State(containers=[container])
     action_event = context.on.action("grant-admin-role", params={"user": user})
     with pytest.raises(ops.testing.ActionFailed) as exc:
         context.run(action_event, state_in)
-    assert (
-        "Mattermost socket failed to initialize after 30 seconds" in exc.value.message
-    )
+    assert "Mattermost socket failed to initialize after 30 seconds" in exc.value.message
     state_out = exc.value.state
     plan = state_out.get_container("app").plan
     env = plan.services["go"].environment
     assert env["MM_SERVICESETTINGS_ENABLELOCALMODE"] == "false"
+
+
+def _job_api(method: str, job: dict) -> ops.testing.Exec:
+    """Mock a call to the Mattermost jobs API through the local mode socket.
+
+    Args:
+        method: HTTP method of the call.
+        job: job returned by the call.
+
+    Returns:
+        The mocked curl execution.
+    """
+    return ops.testing.Exec(
+        command_prefix=[
+            "curl",
+            "--silent",
+            "--show-error",
+            "--fail",
+            "--unix-socket",
+            SOCKET_PATH,
+            "--request",
+            method,
+        ],
+        return_code=0,
+        stdout=json.dumps(job),
+    )
+
+
+@patch("time.sleep", return_value=None)
+@pytest.mark.parametrize(
+    "final_status, succeeded",
+    [pytest.param("success", True, id="success"), pytest.param("error", False, id="error")],
+)
+def test_reindex_search(
+    mock_sleep: MagicMock, final_status: str, succeeded: bool, context: ops.testing.Context
+) -> None:
+    """Test the reindex-search action reporting the progress of the reindex job.
+
+    arrange: Mock the socket check and the jobs API, the reindex job ending with the
+        given status, and set up the container, the opensearch relation and action event.
+    act: Run the reindex-search action.
+    assert: The action reports the progress of the job, succeeds only if the job does, and
+        local mode is disabled in the final state.
+    """
+    mock_socket_check = ops.testing.Exec(
+        command_prefix=["/app/bin/mmctl", "--local", "system", "status"], return_code=0
+    )
+    job = {"id": "job-id", "type": "elasticsearch_post_indexing"}
+    container = ops.testing.Container(
+        name="app",
+        can_connect=True,
+        execs=[
+            mock_socket_check,
+            _job_api("POST", {**job, "status": "pending"}),
+            _job_api("GET", {**job, "status": final_status, "progress": 100}),
+        ],
+    )
+    opensearch = ops.testing.Relation(endpoint="opensearch", remote_app_name="opensearch")
+    state_in = ops.testing.State(containers=[container], relations=[opensearch])
+    action_event = context.on.action("reindex-search")
+
+    if succeeded:
+        state_out = context.run(action_event, state_in)
+        assert context.action_results == {
+            "job-id": "job-id",
+            "status": "success",
+            "duration": 10,
+        }
+    else:
+        with pytest.raises(ops.testing.ActionFailed) as exc:
+            context.run(action_event, state_in)
+        assert "Job job-id ended with status error" in exc.value.message
+        state_out = exc.value.state
+    assert context.action_logs == [
+        "Started elasticsearch_post_indexing job job-id",
+        f"Job job-id {final_status}: 100%",
+    ]
+    env = state_out.get_container("app").plan.services["go"].environment
+    assert env["MM_SERVICESETTINGS_ENABLELOCALMODE"] == "false"
+
+
+def test_reindex_search_without_opensearch(context: ops.testing.Context) -> None:
+    """Test the reindex-search action without the opensearch integration.
+
+    arrange: Set up the container without the opensearch relation.
+    act: Run the reindex-search action.
+    assert: The action fails as there is nothing to reindex.
+    """
+    container = ops.testing.Container(name="app", can_connect=True)
+    state_in = ops.testing.State(containers=[container])
+
+    with pytest.raises(ops.testing.ActionFailed) as exc:
+        context.run(context.on.action("reindex-search"), state_in)
+    assert "opensearch integration is required" in exc.value.message
+
+
+def _rclone_stats(transfers: int, checks: int, total: int) -> str:
+    """Build a statistics log line of rclone.
+
+    Args:
+        transfers: Number of files uploaded.
+        checks: Number of files already present in the bucket.
+        total: Number of files to upload.
+
+    Returns:
+        The JSON log line.
+    """
+    stats = {
+        "bytes": transfers * 1048576,
+        "checks": checks,
+        "elapsedTime": 20.0,
+        "errors": 0,
+        "speed": 52428.8,
+        "totalBytes": total * 1048576,
+        "totalTransfers": total,
+        "transfers": transfers,
+    }
+    return json.dumps({"level": "notice", "msg": "stats", "stats": stats})
+
+
+@pytest.mark.parametrize(
+    "return_code, succeeded",
+    [pytest.param(0, True, id="success"), pytest.param(1, False, id="error")],
+)
+def test_migrate_files_to_s3(
+    return_code: int, succeeded: bool, context: ops.testing.Context
+) -> None:
+    """Test the migrate-files-to-s3 action reporting the progress of the upload.
+
+    arrange: Mock rclone reporting its statistics, and set up the container, the s3
+        relation and action event.
+    act: Run the migrate-files-to-s3 action.
+    assert: rclone copies the file store to the path of the bucket Mattermost uses,
+        skipping matching objects, and the action reports the progress and throughput.
+    """
+    log = [_rclone_stats(1, 2, 4)]
+    if not succeeded:
+        log.append(json.dumps({"level": "error", "msg": "Failed to copy: access denied"}))
+    log.append(_rclone_stats(2, 3, 4))
+    rclone = ops.testing.Exec(
+        command_prefix=["rclone", "copy"], return_code=return_code, stderr="\n".join(log)
+    )
+    container = ops.testing.Container(name="app", can_connect=True, execs=[rclone])
+    s3 = ops.testing.Relation(
+        endpoint="s3",
+        remote_app_name="s3-integrator",
+        remote_app_data={
+            "access-key": "access",
+            "secret-key": "secret",
+            "bucket": "mattermost",
+            "endpoint": "https://s3.example.com",
+            "path": "/files/",
+        },
+    )
+    state_in = ops.testing.State(containers=[container], relations=[s3])
+    action_event = context.on.action("migrate-files-to-s3", params={"transfers": 8})
+
+    if succeeded:
+        context.run(action_event, state_in)
+        assert context.action_results == {
+            "uploaded-files": 2,
+            "skipped-files": 3,
+            "uploaded-bytes": 2097152,
+            "duration": 20,
+            "throughput": "0.1 MiB/s",
+        }
+    else:
+        with pytest.raises(ops.testing.ActionFailed) as exc:
+            context.run(action_event, state_in)
+        assert "rerun to resume" in exc.value.message
+        assert "access denied" in exc.value.message
+    (execution,) = context.exec_history["app"]
+    assert execution.command[2:5] == ["/app/data", "mattermost-s3:mattermost/files", "--checksum"]
+    assert "--transfers=8" in execution.command
+    assert execution.environment["RCLONE_CONFIG_MATTERMOST_S3_ENDPOINT"] == (
+        "https://s3.example.com"
+    )
+    assert context.action_logs == [
+        "Uploaded 1/4 files, 1.0/4.0 MiB at 0.1 MiB/s, 2 already present",
+        "Uploaded 2/4 files, 2.0/4.0 MiB at 0.1 MiB/s, 3 already present",
+    ]
+
+
+def test_migrate_files_to_s3_rclone_configuration(
+    tmp_path: pathlib.Path, context: ops.testing.Context
+) -> None:
+    """Test the rclone command and environment of the migrate-files-to-s3 action.
+
+    arrange: Set up the container and a s3 relation with virtual-hosted addressing, a
+        region, a storage class and a CA chain.
+    act: Run the migrate-files-to-s3 action with its default parameters.
+    assert: rclone copies the file store with checksums, so that a rerun skips the objects
+        already uploaded, and its remote is configured from the relation data.
+    """
+    rclone = ops.testing.Exec(command_prefix=["rclone", "copy"], stderr=_rclone_stats(0, 0, 0))
+    container = ops.testing.Container(
+        name="app",
+        can_connect=True,
+        execs=[rclone],
+        mounts={"tmp": ops.testing.Mount(location="/tmp", source=tmp_path)},
+    )
+    s3 = ops.testing.Relation(
+        endpoint="s3",
+        remote_app_name="s3-integrator",
+        remote_app_data={
+            "access-key": "access",
+            "secret-key": "secret",
+            "bucket": "mattermost",
+            "endpoint": "https://s3.example.com",
+            "region": "eu-west-1",
+            "storage-class": "STANDARD_IA",
+            "s3-uri-style": "host",
+            "tls-ca-chain": json.dumps(["-----BEGIN CERTIFICATE-----"]),
+        },
+    )
+    state_in = ops.testing.State(containers=[container], relations=[s3])
+
+    context.run(context.on.action("migrate-files-to-s3"), state_in)
+
+    (execution,) = context.exec_history["app"]
+    assert execution.command == [
+        "rclone",
+        "copy",
+        "/app/data",
+        "mattermost-s3:mattermost",
+        "--checksum",
+        "--transfers=4",
+        "--s3-upload-concurrency=4",
+        "--s3-chunk-size=16M",
+        "--s3-upload-cutoff=16M",
+        "--stats=10s",
+        "--stats-log-level=NOTICE",
+        "--use-json-log",
+        "--ca-cert=/tmp/s3-ca.pem",
+    ]
+    assert execution.environment == {
+        "RCLONE_CONFIG_MATTERMOST_S3_TYPE": "s3",
+        "RCLONE_CONFIG_MATTERMOST_S3_PROVIDER": "Other",
+        "RCLONE_CONFIG_MATTERMOST_S3_ACCESS_KEY_ID": "access",
+        "RCLONE_CONFIG_MATTERMOST_S3_SECRET_ACCESS_KEY": "secret",
+        "RCLONE_CONFIG_MATTERMOST_S3_FORCE_PATH_STYLE": "false",
+        "RCLONE_CONFIG_MATTERMOST_S3_REGION": "eu-west-1",
+        "RCLONE_CONFIG_MATTERMOST_S3_ENDPOINT": "https://s3.example.com",
+        "RCLONE_CONFIG_MATTERMOST_S3_STORAGE_CLASS": "STANDARD_IA",
+    }
+    assert (tmp_path / "s3-ca.pem").read_text() == "-----BEGIN CERTIFICATE-----"
+
+
+def test_migrate_files_to_s3_without_s3(context: ops.testing.Context) -> None:
+    """Test the migrate-files-to-s3 action without the s3 integration.
+
+    arrange: Set up the container without the s3 relation.
+    act: Run the migrate-files-to-s3 action.
+    assert: The action fails as there is no bucket to upload to.
+    """
+    container = ops.testing.Container(name="app", can_connect=True)
+    state_in = ops.testing.State(containers=[container])
+
+    with pytest.raises(ops.testing.ActionFailed) as exc:
+        context.run(context.on.action("migrate-files-to-s3"), state_in)
+    assert "s3 integration is required" in exc.value.message
@@ -9,6 +9,9 @@ import os
 import shutil
 import subprocess
 import pytest
+import yaml
+
+LOKI_RULES_PATH = os.path.join("cos_custom", "loki_alert_rules", "mattermost_logs.rule")
 
 
 @pytest.mark.skipif(
@@ -30,4 +33,21 @@ def test_prometheus_alert_rules():
         text=True,
     )
 
-    assert result.returncode == 0, f"Promtool verification failed:\n{result.stderr}\n{result.stdout}"
\ No newline at end of file
+    assert result.returncode == 0, f"Promtool verification failed:\n{result.stderr}\n{result.stdout}"
+
+
+def test_loki_alert_rules_do_not_parse_json():
+    """
+    arrange: The Mattermost Loki alert rules file.
+    act: Load every alert rule expression.
+    assert: No expression runs the `json` parser stage, so rule evaluation only relies on
+        the ingest-time `detected_level` metadata and line filters.
+    """
+    with open(LOKI_RULES_PATH, encoding="utf-8") as rules_file:
+        groups = yaml.safe_load(rules_file)["groups"]
+
+    expressions = [rule["expr"] for group in groups for rule in group["rules"]]
+
+    assert expressions
+    for expr in expressions:
+        assert "| json" not in expr, f"Loki rule parses every log line as JSON: {expr}"
@@ -5,29 +5,56 @@
 
 """Unit tests."""
 
+import dataclasses
+import os
+import pathlib
+import subprocess
+import time
+from unittest.mock import patch
+
 import ops
 import ops.testing
+import pytest
 
 from charm import MattermostK8sCharm
 
-# Metadata from the go-framework extension (charmcraft expand-extensions).
-# Needed because Scenario cannot expand charmcraft extensions automatically.
+START_SCRIPT = pathlib.Path(__file__).parents[2] / "mattermost_rock" / "start.sh"
+
+# Metadata from charmcraft.yaml, which expands the go-framework extension.
+# The benchmarks in tests/benchmark run the charm with the same metadata.
 CHARM_META = {
     "name": "mattermost-k8s",
-    "containers": {"app": {"resource": "app-image"}},
+    "containers": {
+        "app": {
+            "resource": "app-image",
+            "mounts": [
+                {"storage": "file-store", "location": "/app/data"},
+            ],
+        },
+        "image-cache": {"resource": "image-cache-image"},
+    },
     "peers": {"secret-storage": {"interface": "secret-storage"}},
     "requires": {
         "postgresql": {"interface": "postgresql_client", "optional": False, "limit": 1},
         "s3": {"interface": "s3", "optional": True, "limit": 1},
+        "oauth": {"interface": "oauth", "optional": True, "limit": 1},
         "smtp": {"interface": "smtp", "optional": True, "limit": 1},
         "logging": {"interface": "loki_push_api"},
         "ingress": {"interface": "ingress", "limit": 1},
+        "charm-tracing": {"interface": "tracing", "optional": True, "limit": 1},
+        "opensearch": {"interface": "opensearch_client", "optional": True, "limit": 1},
     },
     "provides": {
         "metrics-endpoint": {"interface": "prometheus_scrape"},
         "grafana-dashboard": {"interface": "grafana_dashboard"},
     },
-    "resources": {"app-image": {"type": "oci-image"}},
+    "resources": {
+        "app-image": {"type": "oci-image"},
+        "image-cache-image": {"type": "oci-image"},
+    },
+    "storage": {
+        "file-store": {"type": "filesystem"},
+    },
 }
 
 CHARM_ACTIONS = {
@@ -36,6 +63,18 @@ CHARM_ACTIONS = {
         "params": {"user": {"type": "string"}},
     },
     "rotate-secret-key": {"description": "Rotate the secret key."},
+    "reindex-search": {
+        "description": "Start a full reindex of the OpenSearch indexes.",
+        "params": {"timeout": {"type": "integer", "default": 3600}},
+    },
+    "migrate-files-to-s3": {
+        "description": "Upload the files of the local file store to S3.",
+        "params": {
+            "transfers": {"type": "integer", "default": 4},
+            "upload-concurrency": {"type": "integer", "default": 4},
+            "chunk-size": {"type": "integer", "default": 16},
+        },
+    },
 }
 
 CHARM_CONFIG = {
@@ -63,6 +102,16 @@ CHARM_CONFIG = {
             "type": "secret",
             "description": "Juju user secret ID for the app secret key.",
         },
+        "oauth-redirect-path": {
+            "type": "string",
+            "default": "/callback",
+            "description": "Path the user is redirected to upon completing login.",
+        },
+        "oauth-scopes": {
+            "type": "string",
+            "default": "openid profile email",
+            "description": "Scopes requested from the OAuth provider.",
+        },
         "licence": {
             "type": "string",
             "default": "",
@@ -78,11 +127,61 @@ CHARM_CONFIG = {
             "default": False,
             "description": "Set log level to DEBUG.",
         },
+        "log-console-json": {
+            "type": "boolean",
+            "default": True,
+            "description": "Write console log lines as JSON.",
+        },
+        "log-levels": {
+            "type": "string",
+            "default": "",
+            "description": "Log levels written to the console.",
+        },
+        "log-max-queue-size": {
+            "type": "int",
+            "default": 1000,
+            "description": "Console log target queue size.",
+        },
+        "database-pooler": {
+            "type": "string",
+            "default": "auto",
+            "description": "Connection pooler between Mattermost and PostgreSQL.",
+        },
+        "restart-coalesce-window": {
+            "type": "int",
+            "default": 30,
+            "description": "Minimum seconds between two workload restarts.",
+        },
         "image-proxy-enabled": {
             "type": "boolean",
             "default": False,
             "description": "Enable the built-in local image proxy.",
         },
+        "image-cache-enabled": {
+            "type": "boolean",
+            "default": False,
+            "description": "Route the traffic through the image cache.",
+        },
+        "image-cache-max-size": {
+            "type": "int",
+            "default": 1024,
+            "description": "Maximum size in megabytes of the image cache.",
+        },
+        "image-cache-max-object-size": {
+            "type": "int",
+            "default": 10,
+            "description": "Maximum size in megabytes of a cached image.",
+        },
+        "image-cache-ttl": {
+            "type": "int",
+            "default": 86400,
+            "description": "Seconds an image is served from the cache.",
+        },
+        "static-cache-enabled": {
+            "type": "boolean",
+            "default": False,
+            "description": "Route the traffic through the static assets cache.",
+        },
         "max-channels-per-team": {
             "type": "int",
             "default": 3000,
@@ -155,13 +254,12 @@ def test_container_not_ready():
         config=CHARM_CONFIG,
     )
     container = ops.testing.Container(name="app", can_connect=False)
+    image_cache = ops.testing.Container(name="image-cache")
     state_in = ops.testing.State(
-        containers={container},
+        containers={container, image_cache},
     )
     state_out = context.run(context.on.config_changed(), state_in)
-    assert state_out.unit_status == ops.testing.WaitingStatus(
-        "Waiting for pebble ready"
-    )
+    assert state_out.unit_status == ops.testing.WaitingStatus("Waiting for pebble ready")
 
 
 def test_missing_postgresql_integration():
@@ -177,13 +275,14 @@ def test_missing_postgresql_integration():
         config=CHARM_CONFIG,
     )
     container = ops.testing.Container(name="app", can_connect=True)
+    image_cache = ops.testing.Container(name="image-cache")
     peer = ops.testing.PeerRelation(
         endpoint="secret-storage",
         local_app_data={"go_secret_key": "test-secret-key"},
     )
     state_in = ops.testing.State(
         leader=True,
-        containers={container},
+        containers={container, image_cache},
         relations={peer},
     )
     state_out = context.run(context.on.pebble_ready(container), state_in)
@@ -203,10 +302,682 @@ def test_missing_peer_relation():
         config=CHARM_CONFIG,
     )
     container = ops.testing.Container(name="app", can_connect=True)
+    image_cache = ops.testing.Container(name="image-cache")
+    state_in = ops.testing.State(
+        containers={container, image_cache},
+    )
+    state_out = context.run(context.on.pebble_ready(container), state_in)
+    assert state_out.unit_status == ops.testing.WaitingStatus("Waiting for peer integration")
+
+
+def test_logging_uses_pebble_log_forwarding():
+    """
+    arrange: State with the container ready and a logging relation to a Loki unit.
+    act: Run pebble_ready hook.
+    assert: The Pebble plan forwards the workload logs to the Loki endpoint natively.
+    """
+    context = ops.testing.Context(
+        charm_type=MattermostK8sCharm,
+        meta=CHARM_META,
+        actions=CHARM_ACTIONS,
+        config=CHARM_CONFIG,
+        juju_version="3.6.0",
+    )
+    container = ops.testing.Container(name="app", can_connect=True)
+    image_cache = ops.testing.Container(name="image-cache")
+    loki_url = "http://loki-0.loki-endpoints:3100/loki/api/v1/push"
+    logging = ops.testing.Relation(
+        endpoint="logging",
+        remote_app_name="loki",
+        remote_units_data={0: {"endpoint": f'{{"url": "{loki_url}"}}'}},
+    )
     state_in = ops.testing.State(
-        containers={container},
+        containers={container, image_cache},
+        relations={logging},
     )
     state_out = context.run(context.on.pebble_ready(container), state_in)
-    assert state_out.unit_status == ops.testing.WaitingStatus(
-        "Waiting for peer integration"
+
+    log_targets = state_out.get_container("app").plan.to_dict()["log-targets"]
+    assert log_targets["loki/0"]["type"] == "loki"
+    assert log_targets["loki/0"]["location"] == loki_url
+    assert log_targets["loki/0"]["services"] == ["all"]
+
+
+def test_secret_credentials_are_fetched_once_per_hook():
+    """
+    arrange: State with a smtp relation whose password is in a Juju secret.
+    act: Create the charm state several times within one hook, then apply a restart.
+    assert: The secret is fetched from Juju once, and once more for the restart.
+    """
+    context = ops.testing.Context(
+        charm_type=MattermostK8sCharm,
+        meta=CHARM_META,
+        actions=CHARM_ACTIONS,
+        config=CHARM_CONFIG,
+    )
+    secret = ops.testing.Secret(tracked_content={"password": "smtp-password"})
+    smtp = ops.testing.Relation(
+        endpoint="smtp",
+        remote_app_name="smtp-integrator",
+        remote_app_data={
+            "host": "smtp.example.com",
+            "port": "587",
+            "user": "mattermost",
+            "password_id": secret.id,
+            "auth_type": "plain",
+            "transport_security": "starttls",
+        },
+    )
+    container = ops.testing.Container(name="app", can_connect=False)
+    image_cache = ops.testing.Container(name="image-cache")
+    state_in = ops.testing.State(
+        containers={container, image_cache}, relations={smtp}, secrets={secret}
+    )
+
+    with context(context.on.update_status(), state_in) as manager:
+        charm = manager.charm
+        with patch.object(charm.model, "get_secret", wraps=charm.model.get_secret) as get_secret:
+            states = [charm._create_charm_state() for _ in range(3)]
+            fetched = get_secret.call_count
+            charm.restart()
+            charm._on_pre_commit(ops.PreCommitEvent(None))
+
+    assert [state.integrations.smtp.password for state in states] == ["smtp-password"] * 3
+    assert fetched == 1
+    assert get_secret.call_count == 2, "once more for the restart applied before commit"
+
+
+def test_restarts_are_coalesced_within_the_window():
+    """
+    arrange: State with the workload started by a config_changed hook.
+    act: Change the configuration twice within the coalescing window, then run update_status
+        once the window is over.
+    assert: The changes within the window do not restart the workload and leave the restart
+        visibly pending, they are applied together by the first hook after the window.
+    """
+    context = ops.testing.Context(
+        charm_type=MattermostK8sCharm,
+        meta=CHARM_META,
+        actions=CHARM_ACTIONS,
+        config=CHARM_CONFIG,
+    )
+    service: ops.pebble.ServiceDict = {
+        "override": "replace",
+        "command": "bash /app/start.sh",
+        "startup": "enabled",
+    }
+    container = ops.testing.Container(
+        name="app",
+        can_connect=True,
+        layers={"rock": ops.pebble.Layer({"services": {"go": service}})},
+        service_statuses={"go": ops.pebble.ServiceStatus.ACTIVE},
+    )
+    image_cache = ops.testing.Container(name="image-cache")
+    peer = ops.testing.PeerRelation(
+        endpoint="secret-storage",
+        local_app_data={"go_secret_key": "test-secret-key"},
+    )
+    postgresql = ops.testing.Relation(
+        endpoint="postgresql",
+        remote_app_name="postgresql-k8s",
+        remote_app_data={
+            "database": "mattermost-k8s",
+            "endpoints": "postgresql-k8s-primary:5432",
+            "username": "user",
+            "password": "pass",
+        },
+    )
+    state = ops.testing.State(
+        leader=True, containers={container, image_cache}, relations={peer, postgresql}
+    )
+    state = context.run(context.on.config_changed(), state)
+    assert state.unit_status == ops.testing.ActiveStatus()
+
+    def environment(state: ops.testing.State) -> dict[str, str]:
+        return state.get_container("app").plan.services["go"].environment
+
+    started = environment(state)
+    for max_file_size in (10, 20):
+        state = dataclasses.replace(state, config={"max-file-size": max_file_size})
+        state = context.run(context.on.config_changed(), state)
+        assert environment(state) == started
+        assert state.unit_status == ops.testing.MaintenanceStatus("restart pending")
+
+    (restarts,) = [stored for stored in state.stored_states if stored.name == "_restarts"]
+    assert restarts.content["pending"]
+    restarts = dataclasses.replace(
+        restarts, content={**restarts.content, "last_restart": time.time() - 30}
+    )
+    state = dataclasses.replace(state, stored_states={restarts})
+    state = context.run(context.on.update_status(), state)
+
+    assert environment(state) != started
+    assert environment(state)["APP_MAX_FILE_SIZE"] == "20"
+    assert state.unit_status == ops.testing.ActiveStatus()
+
+
+def _restart_state(last_restart: float) -> ops.testing.State:
+    """Build a state with a running workload and a pending restart.
+
+    Args:
+        last_restart: time of the last restart of the workload.
+
+    Returns:
+        The hook input state.
+    """
+    service: ops.pebble.ServiceDict = {
+        "override": "replace",
+        "command": "bash /app/start.sh",
+        "startup": "enabled",
+    }
+    container = ops.testing.Container(
+        name="app",
+        can_connect=True,
+        layers={"rock": ops.pebble.Layer({"services": {"go": service}})},
+        service_statuses={"go": ops.pebble.ServiceStatus.ACTIVE},
+    )
+    image_cache = ops.testing.Container(name="image-cache")
+    peer = ops.testing.PeerRelation(
+        endpoint="secret-storage",
+        local_app_data={"go_secret_key": "test-secret-key"},
+    )
+    postgresql = ops.testing.Relation(
+        endpoint="postgresql",
+        remote_app_name="postgresql-k8s",
+        remote_app_data={
+            "database": "mattermost-k8s",
+            "endpoints": "postgresql-k8s-primary:5432",
+            "username": "user",
+            "password": "pass",
+        },
+    )
+    restarts = ops.testing.StoredState(
+        name="_restarts",
+        owner_path="MattermostK8sCharm",
+        content={"last_restart": last_restart, "pending": True, "rerun_migrations": False},
+    )
+    return ops.testing.State(
+        leader=True,
+        containers={container, image_cache},
+        relations={peer, postgresql},
+        stored_states={restarts},
     )
+
+
+def test_restart_waits_for_the_end_of_a_short_window():
+    """
+    arrange: State with a running workload, restarted a few seconds before the end of the
+        coalescing window, and a pending restart.
+    act: Run update_status hook.
+    assert: The hook waits for the end of the window and applies the restart.
+    """
+    context = ops.testing.Context(
+        charm_type=MattermostK8sCharm,
+        meta=CHARM_META,
+        actions=CHARM_ACTIONS,
+        config=CHARM_CONFIG,
+    )
+    state_in = _restart_state(last_restart=time.time() - 25)
+
+    with patch("charm.time.sleep") as sleep:
+        state_out = context.run(context.on.update_status(), state_in)
+
+    ((waited,), _) = sleep.call_args
+    assert 0 < waited <= 5
+    assert "APP_MAX_FILE_SIZE" in state_out.get_container("app").plan.services["go"].environment
+    assert state_out.unit_status == ops.testing.ActiveStatus()
+
+
+def test_unchanged_plan_does_not_open_a_restart_window():
+    """
+    arrange: State with a running workload and a pending restart after the window.
+    act: Run update_status hook twice, the second one without any change to the workload.
+    assert: Only the restart changing the service plan is recorded as a restart.
+    """
+    context = ops.testing.Context(
+        charm_type=MattermostK8sCharm,
+        meta=CHARM_META,
+        actions=CHARM_ACTIONS,
+        config=CHARM_CONFIG,
+    )
+    state = context.run(context.on.update_status(), _restart_state(last_restart=0.0))
+    (restarts,) = [stored for stored in state.stored_states if stored.name == "_restarts"]
+    assert restarts.content["last_restart"] > 0
+
+    restarts = dataclasses.replace(
+        restarts, content={**restarts.content, "last_restart": 1.0, "pending": True}
+    )
+    state = dataclasses.replace(state, stored_states={restarts})
+    state = context.run(context.on.update_status(), state)
+
+    (restarts,) = [stored for stored in state.stored_states if stored.name == "_restarts"]
+    assert restarts.content == {"last_restart": 1.0, "pending": False, "rerun_migrations": False}
+    assert state.unit_status == ops.testing.ActiveStatus()
+
+
+def test_invalid_configuration_blocks_the_coalesced_restart():
+    """
+    arrange: State with a restart postponed by an earlier hook and an unknown database-pooler.
+    act: Run update_status hook, which applies the postponed restart.
+    assert: The charm is blocked with the configuration error instead of failing the hook.
+    """
+    context = ops.testing.Context(
+        charm_type=MattermostK8sCharm,
+        meta=CHARM_META,
+        actions=CHARM_ACTIONS,
+        config=CHARM_CONFIG,
+    )
+    container = ops.testing.Container(name="app", can_connect=True)
+    image_cache = ops.testing.Container(name="image-cache")
+    restarts = ops.testing.StoredState(
+        name="_restarts",
+        owner_path="MattermostK8sCharm",
+        content={"last_restart": 0.0, "pending": True, "rerun_migrations": False},
+    )
+    peer = ops.testing.PeerRelation(
+        endpoint="secret-storage",
+        local_app_data={"go_secret_key": "test-secret-key"},
+    )
+    state_in = ops.testing.State(
+        leader=True,
+        containers={container, image_cache},
+        relations={peer},
+        stored_states={restarts},
+        config={"database-pooler": "bogus"},
+    )
+
+    state_out = context.run(context.on.update_status(), state_in)
+
+    assert state_out.unit_status == ops.testing.BlockedStatus(
+        "invalid database-pooler 'bogus', expected one of auto, pgbouncer, none"
+    )
+
+
+def _workload_environment(
+    endpoints: str,
+    read_only_endpoints: str,
+    remote_app_name: str = "postgresql",
+    config: dict[str, str] | None = None,
+    relations: tuple[ops.testing.Relation, ...] = (),
+    secrets: tuple[ops.testing.Secret, ...] = (),
+    prefix: str = "POSTGRESQL_",
+) -> dict[str, str]:
+    """Run config_changed with a ready workload and get its environment.
+
+    Args:
+        endpoints: endpoints of the postgresql relation.
+        read_only_endpoints: read-only endpoints of the postgresql relation.
+        remote_app_name: name of the application providing the database.
+        config: charm configuration.
+        relations: other relations of the charm.
+        secrets: secrets of the other relations.
+        prefix: prefix of the environment variables to return.
+
+    Returns:
+        The environment variables of the workload service starting with the prefix.
+    """
+    context = ops.testing.Context(
+        charm_type=MattermostK8sCharm,
+        meta=CHARM_META,
+        actions=CHARM_ACTIONS,
+        config=CHARM_CONFIG,
+    )
+    service: ops.pebble.ServiceDict = {
+        "override": "replace",
+        "command": "bash /app/start.sh",
+        "startup": "enabled",
+    }
+    container = ops.testing.Container(
+        name="app",
+        can_connect=True,
+        layers={"rock": ops.pebble.Layer({"services": {"go": service}})},
+    )
+    image_cache = ops.testing.Container(name="image-cache")
+    peer = ops.testing.PeerRelation(
+        endpoint="secret-storage",
+        local_app_data={"go_secret_key": "test-secret-key"},
+    )
+    postgresql = ops.testing.Relation(
+        endpoint="postgresql",
+        remote_app_name=remote_app_name,
+        remote_app_data={
+            "database": "mattermost-k8s",
+            "endpoints": endpoints,
+            "read-only-endpoints": read_only_endpoints,
+            "username": "user",
+            "password": "pass",
+        },
+    )
+    state = ops.testing.State(
+        leader=True,
+        containers={container, image_cache},
+        relations={peer, postgresql, *relations},
+        secrets=set(secrets),
+        config=config or {},
+    )
+    state = context.run(context.on.config_changed(), state)
+    environment = state.get_container("app").plan.services["go"].environment
+    return {key: value for key, value in environment.items() if key.startswith(prefix)}
+
+
+def _datasource(environment: dict[str, str]) -> str:
+    """Render the Mattermost data source with the start script of the rock.
+
+    Args:
+        environment: environment of the workload service.
+
+    Returns:
+        The data source Mattermost connects to PostgreSQL with.
+    """
+    script = START_SCRIPT.read_text().replace(
+        "exec /app/bin/mattermost", 'echo "$MM_SQLSETTINGS_DATASOURCE"'
+    )
+    result = subprocess.run(
+        ["bash", "-c", script],
+        env={"PATH": os.environ["PATH"], **environment},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.splitlines()[-1]
+
+
+def test_postgresql_failover_does_not_change_the_environment():
+    """
+    arrange: A postgresql relation with a primary endpoint and two replicas.
+    act: Start the workload before and after a failover to one of the replicas.
+    assert: Mattermost connects to the primary endpoint only, with a connection timeout, and
+        its data source does not change.
+    """
+    primary = "postgresql-k8s-primary.test.svc.cluster.local:5432"
+    before = _datasource(_workload_environment(primary, "pg-0:5432,pg-1:5432"))
+    after = _datasource(_workload_environment(primary, "pg-1:5432,pg-2:5432"))
+
+    assert before == f"postgres://user:pass@{primary}/mattermost-k8s?connect_timeout=5"
+    assert after == before
+
+
+@pytest.mark.parametrize(
+    "endpoints, remote_app_name, config, pooler",
+    [
+        pytest.param("pg-0:5432", "postgresql", {}, None, id="postgresql"),
+        pytest.param("pg-0:5432", "pgbouncer-k8s", {}, "pgbouncer", id="pgbouncer application"),
+        pytest.param("pg-0:6432", "db-pooler", {}, "pgbouncer", id="pgbouncer port"),
+        pytest.param(
+            "pg-0:5432", "db-pooler", {"database-pooler": "pgbouncer"}, "pgbouncer", id="forced"
+        ),
+        pytest.param(
+            "pg-0:6432", "pgbouncer-k8s", {"database-pooler": "none"}, None, id="disabled"
+        ),
+    ],
+)
+def test_postgresql_pooler_is_detected(endpoints, remote_app_name, config, pooler):
+    """
+    arrange: A postgresql relation with a database or a connection pooler.
+    act: Start the workload.
+    assert: The workload is told about the pooler, if any.
+    """
+    environment = _workload_environment(endpoints, "", remote_app_name, config)
+
+    assert environment.get("POSTGRESQL_DB_POOLER") == pooler
+    assert environment["POSTGRESQL_DB_CONNECT_STRING"].endswith(f"@{endpoints}/mattermost-k8s")
+
+
+def test_unknown_postgresql_pooler_blocks_the_charm():
+    """
+    arrange: State with an unknown database-pooler.
+    act: Run update_status hook.
+    assert: The charm is blocked with the configuration error.
+    """
+    context = ops.testing.Context(
+        charm_type=MattermostK8sCharm,
+        meta=CHARM_META,
+        actions=CHARM_ACTIONS,
+        config=CHARM_CONFIG,
+    )
+    container = ops.testing.Container(name="app", can_connect=True)
+    image_cache = ops.testing.Container(name="image-cache")
+    state_in = ops.testing.State(
+        containers={container, image_cache}, config={"database-pooler": "bogus"}
+    )
+
+    state_out = context.run(context.on.update_status(), state_in)
+
+    assert state_out.unit_status == ops.testing.BlockedStatus(
+        "invalid database-pooler 'bogus', expected one of auto, pgbouncer, none"
+    )
+
+
+def test_opensearch_connection_is_provided_to_the_workload():
+    """
+    arrange: An opensearch relation providing endpoints, credentials and a CA.
+    act: Start the workload.
+    assert: The workload gets the URL of the first endpoint, the credentials and the CA.
+    """
+    secret = ops.testing.Secret(tracked_content={"username": "user", "password": "pass"})
+    tls = ops.testing.Secret(tracked_content={"tls-ca": "-----BEGIN CERTIFICATE-----"})
+    opensearch = ops.testing.Relation(
+        endpoint="opensearch",
+        remote_app_name="opensearch",
+        remote_app_data={
+            "index": "mattermost-k8s",
+            "endpoints": "10.1.0.2:9200,10.1.0.1:9200",
+            "secret-user": secret.id,
+            "secret-tls": tls.id,
+        },
+    )
+
+    environment = _workload_environment(
+        "pg-0:5432", "", relations=(opensearch,), prefix="OPENSEARCH_", secrets=(secret, tls)
+    )
+
+    assert environment == {
+        "OPENSEARCH_URL": "https://10.1.0.1:9200",
+        "OPENSEARCH_USERNAME": "user",
+        "OPENSEARCH_PASSWORD": "pass",
+        "OPENSEARCH_INDEX_PREFIX": "mattermost-k8s_",
+        "OPENSEARCH_CA": "-----BEGIN CERTIFICATE-----",
+    }
+
+
+def test_storage_is_handed_over_to_the_workload_user(tmp_path):
+    """
+    arrange: State with the file-store storage mounted in the container and owned by root.
+    act: Run the storage_attached hook.
+    assert: The mount point is handed over to the workload user before the workload starts.
+    """
+    context = ops.testing.Context(
+        charm_type=MattermostK8sCharm,
+        meta=CHARM_META,
+        actions=CHARM_ACTIONS,
+        config=CHARM_CONFIG,
+    )
+    storage = ops.testing.Storage("file-store")
+    service: ops.pebble.ServiceDict = {
+        "override": "replace",
+        "command": "bash /app/start.sh",
+        "startup": "enabled",
+    }
+    container = ops.testing.Container(
+        name="app",
+        can_connect=True,
+        layers={"rock": ops.pebble.Layer({"services": {"go": service}})},
+        mounts={"file-store": ops.testing.Mount(location="/app/data", source=tmp_path)},
+        execs={ops.testing.Exec(command_prefix=["chown"])},
+    )
+    image_cache = ops.testing.Container(name="image-cache")
+    peer = ops.testing.PeerRelation(
+        endpoint="secret-storage",
+        local_app_data={"go_secret_key": "test-secret-key"},
+    )
+    postgresql = ops.testing.Relation(
+        endpoint="postgresql",
+        remote_app_name="postgresql-k8s",
+        remote_app_data={
+            "database": "mattermost-k8s",
+            "endpoints": "postgresql-k8s-primary:5432",
+            "username": "user",
+            "password": "pass",
+        },
+    )
+    state_in = ops.testing.State(
+        leader=True,
+        containers={container, image_cache},
+        relations={peer, postgresql},
+        storages={storage},
+    )
+
+    state_out = context.run(context.on.storage_attached(storage), state_in)
+
+    assert [exec_.command for exec_ in context.exec_history["app"]] == [
+        ["chown", "584792:584792", "/app/data"]
+    ]
+    assert state_out.unit_status == ops.testing.ActiveStatus()
+
+
+def test_image_cache_fronts_mattermost_when_enabled():
+    """
+    arrange: State with the workload and image-cache containers ready and an ingress relation.
+    act: Enable the image and static assets caches, change their configuration, then disable
+        them.
+    assert: The caching proxy is configured for images, static assets and thumbnails and
+        started, reloaded when its configuration changes, and the ingress targets it instead
+        of Mattermost while it is enabled.
+    """
+    context = ops.testing.Context(
+        charm_type=MattermostK8sCharm,
+        meta=CHARM_META,
+        actions=CHARM_ACTIONS,
+        config=CHARM_CONFIG,
+    )
+    service: ops.pebble.ServiceDict = {
+        "override": "replace",
+        "command": "bash /app/start.sh",
+        "startup": "enabled",
+    }
+    container = ops.testing.Container(
+        name="app",
+        can_connect=True,
+        layers={"rock": ops.pebble.Layer({"services": {"go": service}})},
+    )
+    image_cache = ops.testing.Container(name="image-cache", can_connect=True)
+    peer = ops.testing.PeerRelation(
+        endpoint="secret-storage",
+        local_app_data={"go_secret_key": "test-secret-key"},
+    )
+    postgresql = ops.testing.Relation(
+        endpoint="postgresql",
+        remote_app_name="postgresql-k8s",
+        remote_app_data={
+            "database": "mattermost-k8s",
+            "endpoints": "postgresql-k8s-primary:5432",
+            "username": "user",
+            "password": "pass",
+        },
+    )
+    ingress = ops.testing.Relation(endpoint="ingress", remote_app_name="traefik-k8s")
+    state = ops.testing.State(
+        leader=True,
+        containers={container, image_cache},
+        relations={peer, postgresql, ingress},
+        config={
+            "image-proxy-enabled": True,
+            "image-cache-enabled": True,
+            "static-cache-enabled": True,
+            "image-cache-ttl": 60,
+        },
+    )
+
+    state = context.run(context.on.config_changed(), state)
+
+    assert state.unit_status == ops.testing.ActiveStatus()
+    image_cache = state.get_container("image-cache")
+    assert image_cache.service_statuses["nginx"] == ops.pebble.ServiceStatus.ACTIVE
+    nginx_config = (image_cache.get_filesystem(context) / "etc/nginx/nginx.conf").read_text()
+    assert "proxy_cache_key $arg_url;" in nginx_config
+    assert "inactive=60s" in nginx_config
+    assert "server 127.0.0.1:8080;" in nginx_config
+    assert "proxy_cache_key $uri$static_encoding;" in nginx_config
+    assert 'add_header Cache-Control "private, max-age=86400" always;' in nginx_config
+    assert state.get_relation(ingress.id).local_app_data["port"] == "8081"
+
+    reload = ops.testing.Exec(command_prefix=["nginx", "-s", "reload"])
+    state = dataclasses.replace(
+        state,
+        containers={
+            state.get_container("app"),
+            dataclasses.replace(state.get_container("image-cache"), execs={reload}),
+        },
+        config={
+            "image-proxy-enabled": True,
+            "image-cache-enabled": True,
+            "static-cache-enabled": True,
+            "image-cache-ttl": 120,
+        },
+    )
+    state = context.run(context.on.config_changed(), state)
+
+    image_cache = state.get_container("image-cache")
+    nginx_config = (image_cache.get_filesystem(context) / "etc/nginx/nginx.conf").read_text()
+    assert "inactive=120s" in nginx_config
+    assert [exec_.command for exec_ in context.exec_history["image-cache"]] == [
+        ["nginx", "-s", "reload"]
+    ]
+    assert image_cache.service_statuses["nginx"] == ops.pebble.ServiceStatus.ACTIVE
+
+    state = dataclasses.replace(
+        state,
+        config={
+            "image-proxy-enabled": True,
+            "image-cache-enabled": False,
+            "static-cache-enabled": False,
+        },
+    )
+    state = context.run(context.on.config_changed(), state)
+
+    image_cache = state.get_container("image-cache")
+    assert image_cache.service_statuses["nginx"] == ops.pebble.ServiceStatus.INACTIVE
+    assert state.get_relation(ingress.id).local_app_data["port"] == "8080"
+
+
+@pytest.mark.parametrize(
+    "enabled, port",
+    [pytest.param(True, 8081, id="enabled"), pytest.param(False, 8080, id="disabled")],
+)
+def test_image_cache_state_survives_an_unreachable_container(enabled, port):
+    """
+    arrange: State with a started image cache whose container is unreachable or was
+        rescheduled without the caching proxy.
+    act: Run config_changed hook, with the image cache still enabled or disabled.
+    assert: The workload is still exposed through the image cache while it is enabled, and
+        disabling it does not fail on the missing service.
+    """
+    context = ops.testing.Context(
+        charm_type=MattermostK8sCharm,
+        meta=CHARM_META,
+        actions=CHARM_ACTIONS,
+        config=CHARM_CONFIG,
+    )
+    container = ops.testing.Container(name="app", can_connect=True)
+    image_cache = ops.testing.Container(name="image-cache", can_connect=not enabled)
+    stored_states = {
+        ops.testing.StoredState(
+            name="_image_cache", owner_path="MattermostK8sCharm", content={"running": True}
+        )
+    }
+    state_in = ops.testing.State(
+        leader=True,
+        containers={container, image_cache},
+        stored_states=stored_states,
+        config={
+            "image-proxy-enabled": True,
+            "image-cache-enabled": enabled,
+            "static-cache-enabled": enabled,
+        },
+    )
+
+    with context(context.on.config_changed(), state_in) as manager:
+        state_out = manager.run()
+        assert manager.charm._workload_config.port == port
+    (stored,) = [stored for stored in state_out.stored_states if stored.name == "_image_cache"]
+    assert stored.content["running"] == enabled
@@ -0,0 +1,140 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# Learn more about testing at: https://ops.readthedocs.io/en/latest/explanation/testing.html
+
+"""Unit tests for the configuration of the image cache."""
+
+import re
+
+import pytest
+
+from image_cache import (
+    HASHED_ASSET_PATTERN,
+    ImageCacheConfig,
+    max_integer_pattern,
+    render_nginx_config,
+)
+
+
+@pytest.mark.parametrize("maximum", [0, 7, 10, 20, 999, 1000, 5000, 10 * 1024 * 1024])
+def test_max_integer_pattern(maximum):
+    """
+    arrange: A maximum integer.
+    act: Build the regular expression matching the integers up to the maximum.
+    assert: The integers up to the maximum match, the larger ones do not.
+    """
+    pattern = re.compile(f"^({max_integer_pattern(maximum)})$")
+
+    for value in {*range(0, 1100), maximum - 1, maximum, maximum + 1, maximum * 10}:
+        if value >= 0:
+            assert bool(pattern.match(str(value))) == (value <= maximum), value
+
+
+def _location(config: str, location: str) -> str:
+    """Extract a location block, nested locations included, from an nginx configuration.
+
+    Args:
+        config: The nginx configuration.
+        location: The location line, without its opening brace.
+
+    Returns:
+        The lines of the location block.
+    """
+    lines = config[config.index(f"{location} {{") :].splitlines()
+    depth = 0
+    for index, line in enumerate(lines):
+        depth += line.count("{") - line.count("}")
+        if depth == 0:
+            return "\n".join(lines[: index + 1])
+    raise AssertionError(f"unterminated {location}")
+
+
+def test_render_nginx_config_static_assets():
+    """
+    arrange: The image cache disabled and the static assets cache enabled.
+    act: Render the nginx configuration.
+    assert: The static assets are cached per encoding with the cache headers of Mattermost,
+        except the hashed ones which are immutable, thumbnails are private to the browser and
+        the image proxy is passed through.
+    """
+    config = render_nginx_config(mattermost_port=8065, images=None, static_assets=True)
+
+    assert "listen 8081;" in config
+    assert "server 127.0.0.1:8065;" in config
+    static = _location(config, "location /static/")
+    assert "proxy_cache static;" in static
+    assert "proxy_cache_key $uri$static_encoding;" in static
+    assert "proxy_set_header Accept-Encoding $static_encoding;" in static
+    hashed = _location(static, f'location ~ "{HASHED_ASSET_PATTERN}"')
+    assert 'add_header Cache-Control "public, max-age=31536000, immutable" always;' in hashed
+    assert "proxy_hide_header Cache-Control;" in hashed
+    assert "proxy_hide_header Set-Cookie;" in hashed
+    assert "Cache-Control" not in static.replace(hashed, "")
+    thumbnails = _location(config, "location ~ ^/api/v4/files/[a-z0-9]+/(thumbnail|preview)$")
+    assert 'add_header Cache-Control "private, max-age=86400" always;' in thumbnails
+    assert "/api/v4/image" not in config
+    assert "keys_zone=images" not in config
+
+
+def test_render_nginx_config_images():
+    """
+    arrange: The image cache enabled and the static assets cache disabled.
+    act: Render the nginx configuration.
+    assert: The images are cached per URL for the TTL for logged in users only, and the
+        static assets and thumbnails are passed through.
+    """
+    images = ImageCacheConfig(max_size=2048, max_object_size=1, ttl=600)
+
+    config = render_nginx_config(mattermost_port=8065, images=images, static_assets=False)
+
+    assert "max_size=2048m inactive=600s" in config
+    assert f'"~^({max_integer_pattern(1024 * 1024)})$" 0;' in config
+    image = _location(config, "location = /api/v4/image")
+    assert "auth_request /image-cache-auth;" in image
+    assert "proxy_cache_key $arg_url;" in image
+    assert "proxy_cache_valid 200 600s;" in image
+    assert "proxy_no_cache $image_cache_skip;" in image
+    assert "location = /image-cache-auth {" in config
+    assert "location /static/" not in config
+    assert "thumbnail" not in config
+    assert "gzip on;" not in config
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/static/main.2f3a4b5c6d7e8f90a1b2.js",
+        "/static/1234.0123456789abcdef0123.js",
+        "/static/main.2f3a4b5c6d7e8f90a1b2.css",
+        "/static/files/5a1b2c3d4e5f6a7b8c9d0e1f2a3b4c5d.svg",
+        "/static/files/0f1e2d3c4b5a69788796a5b4c3d2e1f0.woff2",
+    ],
+)
+def test_hashed_asset_pattern_matches_hashed_assets(path):
+    """
+    arrange: Path of a webapp asset with a content hash in its name.
+    act: Match it against the pattern of the immutable assets.
+    assert: The asset is immutable.
+    """
+    assert re.search(HASHED_ASSET_PATTERN, path)
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/static/manifest.json",
+        "/static/remote_entry.js",
+        "/static/root.html",
+        "/static/emoji/1f600.png",
+        "/static/images/logo.png",
+        "/static/plugins/com.mattermost.calls/main.js",
+    ],
+)
+def test_hashed_asset_pattern_skips_mutable_assets(path):
+    """
+    arrange: Path of a webapp asset without a content hash in its name.
+    act: Match it against the pattern of the immutable assets.
+    assert: The asset keeps the cache headers of Mattermost.
+    """
+    assert not re.search(HASHED_ASSET_PATTERN, path)